@@ -1,33 +1,116 @@
 import os
+import atexit
 import argparse
 import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import iem_functions_api as api
+from resolver_cache import ResolverCache
+from token_manager import getTokenManager
+from batch_watcher import BatchWatcher, printBatchSummary
+from iem_policy import CallPolicy
+from config_sync import syncConfigurations
+from device_onboarding import loadDeviceDefinitions, onboardDevices, waitForActivation
+import reconciler
+import iem_metrics
+from rollout_scheduler import runWaves
+from iem_federation import FederatedClient, loadEndpoints
+from rollout_journal import RolloutJournal, defaultJournalPath, recordSubmissions, watchSubmissions
+import iem_daemon
 
-# Optional args if calling script
-parser = argparse.ArgumentParser()
-parser.add_argument("type", help="pipeline or standalone")
-parser.add_argument(
-    "--app_name", help="application name to be created or updated")
-parser.add_argument("--ie_url", help="endpoint of IEM")
-parser.add_argument("--username", help="username for IEM login")
-parser.add_argument("--password", help="password for IEM login")
-parser.add_argument("--devices", help="list of IEDs to deploy app")
-parser.add_argument("--appVersionID", help="app id")
-args = parser.parse_args()
-
-
-def getAppId(ie_url, token, app_name):
-    for app in api.listApps(ie_url, token).content:
-        if app["title"] == app_name:
-            return app["applicationId"]
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="api_handler.py")
+    parser.add_argument(
+        "type", help="pipeline, standalone, config_sync, onboard, reconcile or federation")
+    parser.add_argument(
+        "--app_name", help="application name to be created or updated")
+    parser.add_argument("--ie_url", help="endpoint of IEM")
+    parser.add_argument("--username", help="username for IEM login")
+    parser.add_argument("--password", help="password for IEM login")
+    parser.add_argument("--devices", help="list of IEDs to deploy app")
+    parser.add_argument("--appVersionID", help="app id")
+    parser.add_argument("--parallel", action="store_true",
+                        help="deploy to all devices concurrently with one login")
+    parser.add_argument("--concurrency", type=int, default=10,
+                        help="maximum number of parallel deployments")
+    parser.add_argument("--batch", action="store_true",
+                        help="deploy to all devices with multi-device batches")
+    parser.add_argument("--cache_file",
+                        help="file the device/app name index is kept in between runs")
+    parser.add_argument("--cache_ttl", type=float, default=300,
+                        help="seconds a cached name index stays valid")
+    parser.add_argument("--token_cache",
+                        help="file the IEM token is cached in for the next pipeline job (a directory of per-IEM files for federation)")
+    parser.add_argument("--wait", action="store_true",
+                        help="wait for the submitted batches to finish and fail if any device failed")
+    parser.add_argument("--wait_timeout", type=float, default=3600,
+                        help="seconds to wait for batches to finish")
+    parser.add_argument("--max_retries", type=int, default=3,
+                        help="retries of a failed or throttled IEM request")
+    parser.add_argument("--rate_limit", type=float,
+                        help="maximum IEM requests per second")
+    parser.add_argument("--manifest_dir",
+                        help="directory with manifest.json and configuration files for config_sync")
+    parser.add_argument("--devices_file",
+                        help="CSV or JSON file with the IED definitions to onboard")
+    parser.add_argument("--output_dir", default="onboarding",
+                        help="directory the onboarding files are written to")
+    parser.add_argument("--activation_timeout", type=float, default=0,
+                        help="seconds to wait for onboarded devices to be activated")
+    parser.add_argument("--desired_state",
+                        help="JSON file {device: {app: version}} for reconcile")
+    parser.add_argument("--dry_run", action="store_true",
+                        help="only print the reconcile plan")
+    parser.add_argument("--metrics_out",
+                        help="write per-endpoint request metrics to this file (.prom for Prometheus text, JSON trace otherwise)")
+    parser.add_argument("--waves", action="store_true",
+                        help="staged rollout: canary first, then growing waves gated on batch success")
+    parser.add_argument("--canary_percent", type=float, default=5.0,
+                        help="size of the canary wave in percent of the devices")
+    parser.add_argument("--wave_growth", type=float, default=2.0,
+                        help="size factor between consecutive waves")
+    parser.add_argument("--failure_threshold", type=float, default=0.05,
+                        help="highest tolerated share of failed devices per wave")
+    parser.add_argument("--schedule_interval", type=float,
+                        help="start the waves after the canary this many seconds apart, each gated on the failures so far")
+    parser.add_argument("--batch_size", type=int, default=api.defaultMaxBatchSize,
+                        help="maximum number of devices per batch")
+    parser.add_argument("--iem_config",
+                        help="JSON file with the endpoints and credentials of all IEMs for federation")
+    parser.add_argument("--app_version",
+                        help="version number of --app_name to deploy with federation")
+    parser.add_argument("--journal",
+                        help=f"append-only file recording every submitted and finished device of a pipeline rollout (default with --resume: {defaultJournalPath})")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the rollout recorded in the journal: wait for its running batches and skip completed devices")
+    return parser
+
+
+# Options of the current run, set by main
+args = None
+
+
+def getAppId(tokens, app_name):
+    try:
+        app_id = tokens.call(api.resolveAppId, app_name)
+    except api.IEMApiError as e:
+        print(f"Listing apps failed: {e.response.content}")
+        sys.exit(1)
+    if app_id:
+        return app_id
     print(f"App {app_name} not found in IEM catalog")
     sys.exit(1)
 
 
-def getDeviceIdbyName(ie_url, token, ied_name):
-    for device in api.listAllIEDs(ie_url, token).content:
-        if device["deviceName"] == ied_name:
-            return device["deviceId"]
+def getDeviceIdbyName(tokens, ied_name):
+    try:
+        device_id = tokens.call(api.resolveDeviceId, ied_name)
+    except api.IEMApiError as e:
+        print(f"Listing devices failed: {e.response.content}")
+        sys.exit(1)
+    if device_id:
+        return device_id
     print(f"Device {ied_name} not found in IEM ")
     sys.exit(1)
 
@@ -49,19 +132,406 @@ def install_application(app_id, appVersionid, ie_url=None, username=None, passwo
     if not ied_name:
         ied_name = os.environ["IED_NAME"]
 
-    token = api.loginDirect(ie_url, username, password).content
+    tokens = login(ie_url, username, password)
     print(ied_name)
-    device = getDeviceIdbyName(ie_url, token, ied_name)
-    api.deployAppToIED(ie_url, token, app_id, appVersionid, device)
+    device = getDeviceIdbyName(tokens, ied_name)
+    tokens.call(api.deployAppToIED, app_id, appVersionid, device)
 
 
-if __name__ == "__main__":
+def getDeviceIdsByName(tokens, ied_names):
+    device_ids = {}
+    try:
+        for name in ied_names:
+            device_id = tokens.call(api.resolveDeviceId, name)
+            if device_id:
+                device_ids[name] = device_id
+    except api.IEMApiError as e:
+        print(f"Listing devices failed: {e.response.content}")
+        sys.exit(1)
+    missing = [name for name in ied_names if name not in device_ids]
+    if missing:
+        print(f"Devices {', '.join(missing)} not found in IEM ")
+        sys.exit(1)
+    return device_ids
+
+
+def iem_credentials(ie_url=None, username=None, password=None):
+    return (ie_url or os.environ["IE_URL"], username or os.environ["IE_USER"],
+            password or os.environ["IE_PASSWORD"])
+
+
+def login(ie_url, username, password):
+    tokens = getTokenManager(ie_url, username, password,
+                             cacheFile=args.token_cache)
+    try:
+        tokens.token()
+    except api.IEMApiError as e:
+        print(f"Login to {ie_url} failed: {e.response.content}")
+        sys.exit(1)
+    return tokens
+
+
+def deploy_to_device(tokens, app_id, appVersionid, ied_name, device_id):
+    start = time.perf_counter()
+    try:
+        # one-device batch, so that the batch id can be tracked; TokenManager.call repeats it after a 401
+        result = tokens.call(api.deployAppToIEDs,
+                             app_id, appVersionid, [device_id])[0][1]
+    except Exception as e:
+        result = api.RelevantResponse(False, -1, 'error', e)
+    return ied_name, result, time.perf_counter() - start
+
+
+def print_deploy_summary(results, elapsed):
+    print(f"{'Device':<30} {'Result':<8} {'Status':<8} {'Time (s)':>9}")
+    for ied_name, result, duration in sorted(results, key=lambda r: r[0]):
+        outcome = "OK" if result.success else "FAILED"
+        print(
+            f"{ied_name:<30} {outcome:<8} {str(result.statusCode):<8} {duration:>9.2f}")
+        if not result.success:
+            print(f"    {result.content}")
+    failed = sum(1 for _, result, _ in results if not result.success)
+    print(
+        f"{len(results) - failed}/{len(results)} deployments triggered in {elapsed:.2f}s")
+
+
+def open_journal(tokens, app_id, appVersionid, device_ids, wait_timeout=3600):
+    """
+    Returns the rollout journal (None without --journal and --resume) and the names of the devices to deploy.
+    With --resume, the batches still running in the journal are polled until they finish, and devices that
+    completed or are still running are skipped.
+    """
+    if not (args.journal or args.resume):
+        return None, list(device_ids)
+    journal = RolloutJournal(args.journal or defaultJournalPath, app_id, appVersionid)
+    remaining = list(device_ids)
+    if args.resume:
+        in_flight = journal.inFlight()
+        if in_flight:
+            print(
+                f"Waiting for {sum(len(ids) for ids in in_flight.values())} devices in {len(in_flight)} batches submitted before")
+            watcher = BatchWatcher(tokens, timeout=wait_timeout)
+            for batch_id, ids in in_flight.items():
+                watcher.add(batch_id, ids)
+            outcomes = watcher.wait()
+            journal.outcomes(outcomes)
+            printBatchSummary(outcomes, {device_id: name for name, device_id in device_ids.items()})
+        done = journal.completed() | {device_id for ids in journal.inFlight().values() for device_id in ids}
+        remaining = [name for name in device_ids if device_ids[name] not in done]
+        print(
+            f"Resuming: {len(device_ids) - len(remaining)} devices completed or still running, {len(remaining)} to deploy")
+    journal.planned([device_ids[name] for name in remaining])
+    return journal, remaining
+
+
+def wait_for_batches(tokens, submitted, device_ids, timeout, journal=None):
+    """Waits for (batch data, device ids) submissions to finish and returns True if every device succeeded."""
+    outcomes, untracked = watchSubmissions(tokens, submitted, timeout, journal)
+    names_by_id = {device_id: name for name, device_id in device_ids.items()}
+    if untracked:
+        print(
+            f"No batch id returned for {', '.join(names_by_id.get(d, d) for d in untracked)}")
+    failed = printBatchSummary(outcomes, names_by_id)
+    return failed == 0 and not untracked
+
+
+def install_application_parallel(app_id, appVersionid, ied_names, concurrency=10, ie_url=None, username=None, password=None, wait=False, wait_timeout=3600):
+    if not ie_url:
+        ie_url = os.environ["IE_URL"]
+    if not username:
+        username = os.environ["IE_USER"]
+    if not password:
+        password = os.environ["IE_PASSWORD"]
+
+    api.configureClient(ie_url, poolMaxsize=concurrency)
+    tokens = login(ie_url, username, password)
+    device_ids = getDeviceIdsByName(tokens, ied_names)
+    journal, ied_names = open_journal(tokens, app_id, appVersionid, device_ids, wait_timeout)
+
+    start = time.perf_counter()
+    results = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(deploy_to_device, tokens, app_id, appVersionid, name, device_ids[name])
+                   for name in ied_names]
+        for future in as_completed(futures):
+            name, result, elapsed = future.result()
+            recordSubmissions(journal, [([device_ids[name]], result)])
+            results.append((name, result, elapsed))
+    print_deploy_summary(results, time.perf_counter() - start)
+    ok = all(result.success for _, result, _ in results)
+    if wait:
+        submitted = [(result.content, [device_ids[name]])
+                     for name, result, _ in results if result.success]
+        ok = wait_for_batches(tokens, submitted, device_ids, wait_timeout, journal) and ok
+    return ok
+
+
+def install_application_batch(app_id, appVersionid, ied_names, batch_size=api.defaultMaxBatchSize, ie_url=None, username=None, password=None, wait=False, wait_timeout=3600):
+    if not ie_url:
+        ie_url = os.environ["IE_URL"]
+    if not username:
+        username = os.environ["IE_USER"]
+    if not password:
+        password = os.environ["IE_PASSWORD"]
+
+    tokens = login(ie_url, username, password)
+    device_ids = getDeviceIdsByName(tokens, ied_names)
+    names_by_id = {device_id: name for name, device_id in device_ids.items()}
+    journal, ied_names = open_journal(tokens, app_id, appVersionid, device_ids, wait_timeout)
+
+    start = time.perf_counter()
+    results = []
+    # one batch at a time, so that the journal has every submitted batch even if the job is killed in between
+    for batch in api._chunks([device_ids[name] for name in ied_names], batch_size):
+        submissions = tokens.call(api.deployAppToIEDs, app_id, appVersionid, batch, batch_size)
+        recordSubmissions(journal, submissions)
+        results.extend(submissions)
+    for chunk, result in results:
+        outcome = "OK" if result.success else "FAILED"
+        print(
+            f"Batch of {len(chunk)} devices: {outcome} ({result.statusCode}) {result.content}")
+        print(f"    {', '.join(names_by_id[device_id] for device_id in chunk)}")
+    failed = sum(len(chunk) for chunk, result in results if not result.success)
+    print(
+        f"{len(ied_names) - failed}/{len(ied_names)} deployments triggered in {len(results)} batches in {time.perf_counter() - start:.2f}s")
+    ok = failed == 0
+    if wait:
+        submitted = [(result.content, chunk)
+                     for chunk, result in results if result.success]
+        ok = wait_for_batches(tokens, submitted, device_ids, wait_timeout, journal) and ok
+    return ok
+
+
+def install_application_sequential(app_id, appVersionid, ied_names, ie_url=None, username=None, password=None, wait=False, wait_timeout=3600):
+    tokens = login(*iem_credentials(ie_url, username, password))
+    device_ids = getDeviceIdsByName(tokens, ied_names)
+    journal, ied_names = open_journal(tokens, app_id, appVersionid, device_ids, wait_timeout)
+    submitted = []
+    ok = True
+    for name in ied_names:
+        print(name)
+        _, result, _ = deploy_to_device(tokens, app_id, appVersionid, name, device_ids[name])
+        recordSubmissions(journal, [([device_ids[name]], result)])
+        if result.success:
+            submitted.append((result.content, [device_ids[name]]))
+        else:
+            print(f"    FAILED ({result.statusCode}) {result.content}")
+            ok = False
+    if wait:
+        ok = wait_for_batches(tokens, submitted, device_ids, wait_timeout, journal) and ok
+    return ok
+
+
+def close_resolver_cache(cache):
+    cache.save()
+    stats = cache.stats()
+    print(
+        f"Name cache: {stats['hits']} hits, {stats['misses']} misses, {stats['loads']} listings fetched")
+
+
+def reconcile(desired_state_file, concurrency=10, batch_size=api.defaultMaxBatchSize, dry_run=False, wait=False, wait_timeout=3600, ie_url=None, username=None, password=None):
+    tokens = login(*iem_credentials(ie_url, username, password))
+    api.configureClient(tokens.iemUrl, poolMaxsize=concurrency)
+    desired = reconciler.loadDesiredState(desired_state_file)
+    device_ids = getDeviceIdsByName(tokens, list(desired))
+
+    start = time.perf_counter()
+    try:
+        installed, failures = reconciler.fetchInstalledApps(tokens, device_ids, concurrency)
+    except api.IEMApiError as e:
+        print(f"Fetching the installed apps failed: {e.response.content}")
+        return False
+    for name, result in failures.items():
+        print(f"Fetching the installed apps of {name} failed, skipping it: {result.content}")
+    plan = reconciler.computePlan({name: apps for name, apps in desired.items() if name not in failures}, installed)
+    print(
+        f"{len(plan)} actions needed on {len(installed)} devices (state fetched in {time.perf_counter() - start:.2f}s)")
+    for action in plan:
+        print(f"    {action}")
+    if dry_run or not plan:
+        return not failures
+
+    try:
+        results = reconciler.executePlan(tokens, plan, device_ids, batch_size)
+    except api.IEMApiError as e:
+        print(f"Reconcile failed: {e.response.content}")
+        return False
+    names_by_id = {device_id: name for name, device_id in device_ids.items()}
+    for kind, app_title, version, chunk, result in results:
+        outcome = "OK" if result.success else "FAILED"
+        print(
+            f"{kind} {app_title} {version or ''} on {len(chunk)} devices: {outcome} ({result.statusCode})")
+        print(f"    {', '.join(names_by_id[device_id] for device_id in chunk)}")
+        if not result.success:
+            print(f"    {result.content}")
+    ok = not failures and all(result.success for *_, result in results)
+    if wait:
+        submitted = [(result.content, chunk)
+                     for _, _, _, chunk, result in results if result.success]
+        ok = wait_for_batches(tokens, submitted, device_ids, wait_timeout) and ok
+    return ok
+
+
+def install_application_waves(app_id, appVersionid, ied_names, ie_url=None, username=None, password=None):
+    tokens = login(*iem_credentials(ie_url, username, password))
+    device_ids = getDeviceIdsByName(tokens, ied_names)
+    journal, ied_names = open_journal(tokens, app_id, appVersionid, device_ids, args.wait_timeout)
+    return runWaves(tokens, app_id, appVersionid, {name: device_ids[name] for name in ied_names},
+                    args.canary_percent, args.wave_growth, args.failure_threshold, args.batch_size,
+                    args.wait_timeout, args.schedule_interval, journal)
+
+
+def federation(iem_config, app_name=None, app_version=None, ied_names=None, batch_size=api.defaultMaxBatchSize, wait=False, wait_timeout=3600, token_dir=None):
+    """Prints the merged device list of all IEMs or, with devices, deploys app_name app_version to them wherever they are."""
+    client = FederatedClient(loadEndpoints(iem_config), token_dir)
+    try:
+        if not ied_names:
+            fleet, failures = client.listDevices()
+            for iem, device in fleet:
+                print(f"{iem:<20} {device.deviceName:<30} {device.deviceId}")
+            print(f"{len(fleet)} devices on {len(client.endpoints) - len(failures)} IEMs")
+            for failure in failures:
+                print(f"Listing devices on {failure.iem} failed: {failure.content}")
+            return not failures
+
+        found, missing = client.resolveDevices(ied_names)
+        if missing:
+            print(f"Devices not found on any IEM: {', '.join(missing)}")
+        ok = not missing
+        for result in client.deployResolved(app_name, app_version, found, batch_size):
+            if not result.success:
+                print(f"Deploying on {result.iem} failed: {result.content}")
+                ok = False
+                continue
+            device_ids = {name: device_id for name, (iem, device_id) in found.items() if iem == result.iem}
+            names_by_id = {device_id: name for name, device_id in device_ids.items()}
+            print(f"{result.iem}:")
+            for chunk, response in result.content:
+                outcome = "OK" if response.success else "FAILED"
+                print(f"    batch of {len(chunk)} devices: {outcome} ({response.statusCode})")
+                if not response.success:
+                    print(f"        {', '.join(names_by_id[d] for d in chunk)}: {response.content}")
+            ok = ok and all(response.success for _, response in result.content)
+            if wait:
+                submitted = [(response.content, chunk) for chunk, response in result.content if response.success]
+                ok = wait_for_batches(client.tokens[result.iem], submitted, device_ids, wait_timeout) and ok
+        return ok
+    finally:
+        client.close()
+
+
+def print_policy_stats():
+    print(f"IEM requests: {api.policyStats()}")
+
+
+# Policy and name cache settings kept between the runs of a persistent process (iem_daemon)
+_warm = {}
+
+
+def _configure(persistent):
+    """Sets up the request policy, metrics and name cache of a run and returns what has to be done when it ends."""
+    finish = [print_policy_stats]
+    policy = (args.max_retries, args.rate_limit)
+    if not persistent or _warm.get("policy") != policy:
+        api.setPolicy(CallPolicy(maxRetries=args.max_retries, rate=args.rate_limit))
+        _warm["policy"] = policy
+    if args.metrics_out:
+        metrics = iem_metrics.setInstrumentation(iem_metrics.Instrumentation(enabled=True))
+        finish.append(lambda: metrics.export(args.metrics_out))
+    elif persistent:
+        iem_metrics.setInstrumentation(iem_metrics.Instrumentation())
+    cache = (args.cache_ttl, args.cache_file)
+    if not persistent or _warm.get("cache") != cache:
+        api.setResolverCache(ResolverCache(args.cache_ttl, args.cache_file))
+        _warm["cache"] = cache
+    resolver = api.resolverCache
+    # the policy and the cache may be kept from an earlier run, but the printed statistics are per run
+    api.policyStats().reset()
+    resolver.resetStats()
+    finish.append(lambda: close_resolver_cache(resolver))
+    return finish
+
+
+def main(argv=None, persistent=False):
+    """
+    Short: Run one command line
+    Description: Parses argv and runs the requested operation. Returns the exit code.
+    With persistent, the pooled connections, tokens and name cache of earlier runs are kept (see iem_daemon) and
+    the statistics are printed when the run ends instead of when the process exits.
+    """
+    global args
+    args = build_parser().parse_args(argv)
+    finish = _configure(persistent)
+    if not persistent:
+        for step in finish:
+            atexit.register(step)
+        return run()
+    try:
+        return run()
+    finally:
+        for step in reversed(finish):
+            step()
+
+
+def run():
     if args.type == "pipeline":
         devices = args.devices.replace(" ", "").split(",")
         appVersionid = args.appVersionID
         app_id = os.environ["APP_ID"]
-        for d in devices:
-            install_application(app_id, appVersionid, ied_name=d)
+        if args.waves:
+            if not install_application_waves(app_id, appVersionid, devices):
+                return 1
+        elif args.batch:
+            if not install_application_batch(app_id, appVersionid, devices, args.batch_size,
+                                             wait=args.wait, wait_timeout=args.wait_timeout):
+                return 1
+        elif args.parallel:
+            if not install_application_parallel(app_id, appVersionid, devices, args.concurrency,
+                                                wait=args.wait, wait_timeout=args.wait_timeout):
+                return 1
+        elif not install_application_sequential(app_id, appVersionid, devices,
+                                                wait=args.wait, wait_timeout=args.wait_timeout):
+            return 1
+    elif args.type == "config_sync":
+        tokens = login(*iem_credentials(args.ie_url,
+                       args.username, args.password))
+        api.configureClient(tokens.iemUrl, poolMaxsize=args.concurrency)
+        try:
+            failed = syncConfigurations(tokens, args.manifest_dir, args.concurrency)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Reading the manifest in {args.manifest_dir} failed: {e!r}")
+            return 1
+        if failed:
+            return 1
+    elif args.type == "onboard":
+        tokens = login(*iem_credentials(args.ie_url,
+                       args.username, args.password))
+        api.configureClient(tokens.iemUrl, poolMaxsize=args.concurrency)
+        definitions = loadDeviceDefinitions(args.devices_file)
+        created = onboardDevices(
+            tokens, definitions, args.output_dir, args.concurrency)
+        pending = waitForActivation(
+            tokens, created, timeout=args.activation_timeout) if args.activation_timeout and created else set()
+        if len(created) < len(definitions) or pending:
+            return 1
+    elif args.type == "reconcile":
+        if not reconcile(args.desired_state, args.concurrency, args.batch_size, args.dry_run,
+                         args.wait, args.wait_timeout, args.ie_url, args.username, args.password):
+            return 1
+    elif args.type == "federation":
+        devices = args.devices.replace(" ", "").split(",") if args.devices else None
+        if not federation(args.iem_config, args.app_name, args.app_version, devices, args.batch_size,
+                          args.wait, args.wait_timeout, args.token_cache):
+            return 1
     elif args.type == "standalone":
         install_application(args.app_name, args.ie_url,
                             args.username, args.password, args.devices)
+    else:
+        print(f"Unknown type {args.type}")
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    code = None if os.environ.get("IEM_NO_DAEMON") else iem_daemon.forward(sys.argv[1:])
+    sys.exit(main() if code is None else code)
@@ -0,0 +1,142 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import iem_functions_api as api
+
+artifactPaths = ["Dockerfile", "docker-compose.yml",
+                 "docker-compose.prod.yml", "html", "icon"]
+
+
+def hashArtifacts(appDir, paths=artifactPaths):
+    """Returns one sha256 over the relative path and content of every file below the given paths of appDir."""
+    files = []
+    for path in paths:
+        full = os.path.join(appDir, path)
+        if os.path.isdir(full):
+            for root, _, names in os.walk(full):
+                files.extend(os.path.join(root, name) for name in names)
+        elif os.path.isfile(full):
+            files.append(full)
+    digest = hashlib.sha256()
+    for full in sorted(files):
+        digest.update(os.path.relpath(full, appDir).replace(os.sep, "/").encode())
+        digest.update(b"\0")
+        digest.update(api.fileSha256(full).encode())
+    return digest.hexdigest()
+
+
+def nextVersion(version):
+    """Increments the last component of a dotted version, carrying into the previous one when it overflows its width."""
+    if not version:
+        return "0.0.1"
+    parts = version.split(".")
+    width = len(parts[-1])
+    last = int(parts[-1]) + 1
+    if len(parts) > 1 and len(str(last)) > width:
+        parts[-2] = str(int(parts[-2]) + 1)
+    parts[-1] = str(last % 10 ** width).zfill(width) if len(parts) > 1 else str(last)
+    return ".".join(parts)
+
+
+def newestVersion(iemUrl, token, appId):
+    result = api.getAppVersions(iemUrl, token, appId)
+    if not result.success:
+        raise api.IEMApiError(result)
+    return result.content[0] if result.content else None
+
+
+def loadState(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def writeOutputs(**outputs):
+    """Prints the outputs and, inside GitHub Actions, writes them to $GITHUB_OUTPUT."""
+    for name, value in outputs.items():
+        print(f"{name}={value}")
+    if os.environ.get("GITHUB_OUTPUT"):
+        with open(os.environ["GITHUB_OUTPUT"], "a") as f:
+            for name, value in outputs.items():
+                f.write(f"{name}={value}\n")
+
+
+def check(iemUrl, token, appId, appDir, statePath):
+    """
+    Short: Decide whether a new app version has to be published
+    Description: Compares the artifact hash with the hash recorded for the newest IEM version. The app is unchanged
+    only if the newest version on the IEM is the one recorded by the last publish and the artifacts hash the same.
+    """
+    digest = hashArtifacts(appDir)
+    newest = newestVersion(iemUrl, token, appId)
+    state = loadState(statePath)
+    version = newest["versionNumber"] if newest else ""
+    changed = not (newest and state.get("appId") == appId and state.get("versionId") == newest["versionId"]
+                   and state.get("hash") == digest)
+    writeOutputs(changed=str(changed).lower(), hash=digest, version=version,
+                 version_new=nextVersion(version) if changed else version)
+    return changed
+
+
+def record(iemUrl, token, appId, appDir, statePath):
+    """Records the artifact hash for the newest IEM version after it was published."""
+    newest = newestVersion(iemUrl, token, appId)
+    if not newest:
+        print(f"App {appId} has no versions to record")
+        return False
+    state = {"appId": appId, "versionId": newest["versionId"], "versionNumber": newest["versionNumber"],
+             "hash": hashArtifacts(appDir)}
+    with open(statePath, "w") as f:
+        json.dump(state, f)
+    print(f"Recorded version {state['versionNumber']} with hash {state['hash']}")
+    return True
+
+
+def printNewest(iemUrl, token, appId):
+    """Prints only the versionId of the newest IEM version, for use in $(...) of a workflow step."""
+    newest = newestVersion(iemUrl, token, appId)
+    if not newest:
+        print(f"App {appId} has no versions", file=sys.stderr)
+        return False
+    print(newest["versionId"])
+    return True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["check", "record", "newest"],
+                        help="check: decide whether to publish, record: store the hash of the published version, newest: print the versionId of the newest version")
+    parser.add_argument("--app_dir", default="app",
+                        help="directory with the app artifacts")
+    parser.add_argument("--state", default=".publish-state.json",
+                        help="file holding the hash of the last published version")
+    parser.add_argument("--app_id", default=os.environ.get("APP_ID"))
+    parser.add_argument("--ie_url", default=os.environ.get("IE_URL"))
+    parser.add_argument("--username", default=os.environ.get("IE_USER"))
+    parser.add_argument("--password", default=os.environ.get("IE_PASSWORD"))
+    args = parser.parse_args(argv)
+
+    login = api.loginDirect(args.ie_url, args.username, args.password)
+    if not login.success:
+        print(f"Login to {args.ie_url} failed: {login.content}", file=sys.stderr)
+        return 1
+    try:
+        if args.command == "check":
+            check(args.ie_url, login.content, args.app_id, args.app_dir, args.state)
+            return 0
+        if args.command == "newest":
+            return 0 if printNewest(args.ie_url, login.content, args.app_id) else 1
+        return 0 if record(args.ie_url, login.content, args.app_id, args.app_dir, args.state) else 1
+    except api.IEMApiError as e:
+        print(f"Reading versions of {args.app_id} failed: {e.response.content}", file=sys.stderr)
+        return 1
+    finally:
+        api.logout(args.ie_url, login.content)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
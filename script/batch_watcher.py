@@ -0,0 +1,157 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import iem_functions_api as api
+
+successStates = {"COMPLETED", "COMPLETE", "SUCCESS", "SUCCEEDED", "SUCCESSFUL", "DONE", "FINISHED"}
+failureStates = {"FAILED", "FAILURE", "ERROR", "CANCELLED", "CANCELED", "ABORTED", "REJECTED", "TIMEOUT",
+                 "PARTIALLY_FAILED", "PARTIALLYFAILED"}
+
+
+def _state(item):
+    state = item.get("status") or item.get("state") or ""
+    return str(state).upper()
+
+
+class DeviceOutcome:
+    def __init__(self, deviceId, batchId, submittedAt):
+        self.deviceId = deviceId
+        self.batchId = batchId
+        self.state = "SUBMITTED"
+        self.submittedAt = submittedAt
+        self.finishedAt = None
+
+    @property
+    def done(self):
+        return self.state in successStates or self.state in failureStates
+
+    @property
+    def success(self):
+        return self.state in successStates
+
+    @property
+    def duration(self):
+        return (self.finishedAt or time.time()) - self.submittedAt
+
+    def update(self, state, now):
+        if self.done or not state or state == self.state:
+            return False
+        self.state = state
+        if self.done:
+            self.finishedAt = now
+        return True
+
+
+class BatchWatcher:
+    """
+    Short: Track many IEM batches until they finish
+    Description: Polls every pending batch once per shared cycle instead of running one polling loop per batch.
+    The interval starts at initialInterval, grows by backoffFactor (up to maxInterval) for every cycle without a state
+    change, falls back to initialInterval when something changes, and is randomised by +/- jitter.
+    : param tokens:          (TokenManager) token manager of the IEM the batches run on [required]
+    : param initialInterval: (float) seconds between the first polls [optional]
+    : param maxInterval:     (float) upper limit of the poll interval [optional]
+    : param backoffFactor:   (float) growth of the interval per idle cycle [optional]
+    : param jitter:          (float) relative randomisation of the interval [optional]
+    : param timeout:         (float) seconds after which unfinished devices are reported as TIMEOUT [optional]
+    : param concurrency:     (int) maximum number of status requests in flight per cycle [optional]
+    """
+
+    def __init__(self, tokens, initialInterval=2.0, maxInterval=60.0, backoffFactor=2.0, jitter=0.2, timeout=3600, concurrency=10):
+        self.tokens = tokens
+        self.initialInterval = initialInterval
+        self.maxInterval = maxInterval
+        self.backoffFactor = backoffFactor
+        self.jitter = jitter
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.polls = 0
+        self.cycles = 0
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def add(self, batchId, deviceIds, submittedAt=None):
+        submittedAt = submittedAt or time.time()
+        with self._lock:
+            outcomes = self._batches.setdefault(str(batchId), {})
+            for deviceId in api._deviceList(deviceIds):
+                outcomes[deviceId] = DeviceOutcome(
+                    deviceId, str(batchId), submittedAt)
+
+    def outcomes(self):
+        with self._lock:
+            return [outcome for batch in self._batches.values() for outcome in batch.values()]
+
+    def _pending(self):
+        with self._lock:
+            return [batchId for batchId, batch in self._batches.items()
+                    if any(not outcome.done for outcome in batch.values())]
+
+    def _apply(self, batchId, status):
+        now = time.time()
+        changed = False
+        with self._lock:
+            outcomes = self._batches[batchId]
+            jobs = []
+            if isinstance(status, dict):
+                jobs = status.get("jobs") or status.get("devices") or []
+            for job in jobs:
+                outcome = outcomes.get(job.get("deviceId"))
+                if outcome is not None:
+                    changed |= outcome.update(_state(job), now)
+            if not jobs and isinstance(status, dict):
+                for outcome in outcomes.values():
+                    changed |= outcome.update(_state(status), now)
+        return changed
+
+    def _poll(self, batchId):
+        result = self.tokens.call(api.getBatchStatus, batchId)
+        with self._lock:
+            self.polls += 1
+        if not result.success:
+            return False
+        return self._apply(batchId, result.content)
+
+    def wait(self, until=None):
+        """
+        Polls until every tracked device has finished or the timeout expired, and returns the DeviceOutcome list.
+        With until (a time.time() value), stops polling at that time if it comes first, leaving unfinished devices
+        as they are, so that wait can be called again.
+        """
+        deadline = time.time() + self.timeout
+        stopAt = min(deadline, until) if until is not None else deadline
+        interval = self.initialInterval
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            while True:
+                pending = self._pending()
+                if not pending:
+                    break
+                self.cycles += 1
+                changed = any(list(pool.map(self._poll, pending)))
+                if not self._pending():
+                    break
+                if until is not None and until < deadline and time.time() >= until:
+                    break
+                if time.time() >= deadline:
+                    now = time.time()
+                    for outcome in self.outcomes():
+                        outcome.update("TIMEOUT", now)
+                    break
+                interval = self.initialInterval if changed else min(
+                    self.maxInterval, interval * self.backoffFactor)
+                delay = interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+                time.sleep(max(0.0, min(delay, stopAt - time.time())))
+        return self.outcomes()
+
+
+def printBatchSummary(outcomes, names=None):
+    """Prints the final state of every device and returns the number of devices that did not succeed."""
+    names = names or {}
+    print(f"{'Device':<30} {'State':<18} {'Batch':<38} {'Time (s)':>9}")
+    for outcome in sorted(outcomes, key=lambda o: names.get(o.deviceId, o.deviceId)):
+        print(
+            f"{names.get(outcome.deviceId, outcome.deviceId):<30} {outcome.state:<18} {outcome.batchId:<38} {outcome.duration:>9.1f}")
+    failed = sum(1 for outcome in outcomes if not outcome.success)
+    print(f"{len(outcomes) - failed}/{len(outcomes)} devices finished successfully")
+    return failed
@@ -0,0 +1,144 @@
+"""Deploy throughput benchmark against the local mock IEM.
+
+    python3 benchmark.py --sizes 10,100,1000 --latency 0.02 --concurrency 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+import iem_functions_api as api
+from iem_policy import CallPolicy
+
+appId = "app-0000"
+appVersionId = "app-0000-v1"
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))]
+
+
+def _timed(call, *args):
+    start = time.perf_counter()
+    result = call(*args)
+    return result, time.perf_counter() - start
+
+
+def _perBatch(timedResults):
+    """Flattens (deployAppToIEDs result, duration) pairs into (devices, success, duration) rows."""
+    return [(len(chunk), result.success, duration)
+            for submitted, duration in timedResults for chunk, result in submitted]
+
+
+def runSequential(url, token, deviceIds, concurrency, batchSize):
+    return _perBatch([_timed(api.deployAppToIEDs, url, token, appId, appVersionId, [d])
+                      for d in deviceIds])
+
+
+def runParallel(url, token, deviceIds, concurrency, batchSize):
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return _perBatch(pool.map(lambda d: _timed(api.deployAppToIEDs, url, token, appId, appVersionId, [d]),
+                                  deviceIds))
+
+
+def runBatched(url, token, deviceIds, concurrency, batchSize):
+    return _perBatch([_timed(api.deployAppToIEDs, url, token, appId, appVersionId, chunk, batchSize)
+                      for chunk in api._chunks(deviceIds, batchSize)])
+
+
+modes = {"sequential": runSequential, "parallel": runParallel, "batched": runBatched}
+
+
+def startMockProcess(devices, latency=0.0, jitter=0.0, errorRate=0.0, rateLimit=0):
+    """
+    Starts mock_iem.py in its own process on a free port and returns (process, url), so that the memory and the
+    threads of the server do not count towards the measured client.
+    """
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_iem.py"), "--port", "0",
+         "--devices", str(devices), "--latency", str(latency), "--jitter", str(jitter), "--error_rate", str(errorRate),
+         "--rate_limit", str(rateLimit), "--batch_seconds", "0"],
+        stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line:
+        process.wait()
+        raise RuntimeError(f"Mock IEM exited with code {process.returncode}")
+    return process, line.split()[-1]
+
+
+def benchmark(mode, devices, latency=0.0, jitter=0.0, errorRate=0.0, rateLimit=0, concurrency=10, batchSize=100):
+    """
+    Short: Benchmark one rollout strategy
+    Description: Starts a mock IEM process with the given number of devices and deploys one app version to all of
+    them. Returns deploys per second, p50/p99 latency of the deploy requests and the peak Python heap of the client
+    during the rollout.
+    """
+    server, url = startMockProcess(devices, latency, jitter, errorRate, rateLimit)
+    try:
+        api.setPolicy(CallPolicy())
+        api.configureClient(url, poolMaxsize=concurrency)
+        token = api.loginDirect(url, "bench", "bench").content
+        deviceIds = [d["deviceId"] for d in api.iterIEDs(url, token)]
+        requestsBefore = api.policyStats().requests
+        tracemalloc.start()
+        start = time.perf_counter()
+        results = modes[mode](url, token, deviceIds, concurrency, batchSize)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        requests = api.policyStats().requests - requestsBefore
+    finally:
+        api.closeClients()
+        server.terminate()
+        server.wait()
+    durations = [duration for _, _, duration in results]
+    deployed = sum(count for count, success, _ in results if success)
+    return {
+        "mode": mode,
+        "devices": devices,
+        "deployed": deployed,
+        "requests": requests,
+        "seconds": round(elapsed, 3),
+        "deploysPerSecond": round(deployed / elapsed, 1) if elapsed else 0.0,
+        "p50Ms": round(_percentile(durations, 50) * 1000, 1),
+        "p99Ms": round(_percentile(durations, 99) * 1000, 1),
+        "meanMs": round(statistics.mean(durations) * 1000, 1) if durations else 0.0,
+        "peakKiB": round(peak / 1024, 1),
+        "retries": api.policyStats().retries,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,1000",
+                        help="comma separated device counts")
+    parser.add_argument("--modes", default=",".join(modes),
+                        help="comma separated rollout modes")
+    parser.add_argument("--latency", type=float, default=0.01,
+                        help="server latency per request in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--rate_limit", type=float, default=0)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--batch_size", type=int, default=100)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    rows = []
+    print(f"{'mode':<11} {'devices':>7} {'requests':>8} {'seconds':>8} {'deploys/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'peak KiB':>9} {'retries':>7}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        for mode in args.modes.split(","):
+            row = benchmark(mode, size, args.latency, args.jitter, args.error_rate, args.rate_limit,
+                            args.concurrency, args.batch_size)
+            rows.append(row)
+            print(f"{row['mode']:<11} {row['devices']:>7} {row['requests']:>8} {row['seconds']:>8} {row['deploysPerSecond']:>10} {row['p50Ms']:>8} {row['p99Ms']:>8} {row['peakKiB']:>9} {row['retries']:>7}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
@@ -0,0 +1,150 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import iem_functions_api as api
+
+manifestName = "manifest.json"
+
+
+def loadManifest(manifestDir):
+    """
+    Short: Read a configuration manifest
+    Description: Reads manifest.json from manifestDir. It holds a list of entries, one per configuration:
+    {"appId" or "appTitle", "displayName", "description", "volPath", "relativePath", "file",
+     "referenceName" (optional, default: hash prefix), "versionDescription" (optional), "contentType" (optional)}
+    "file" is relative to manifestDir.
+    """
+    with open(os.path.join(manifestDir, manifestName)) as f:
+        entries = json.load(f)
+    for entry in entries:
+        entry["path"] = os.path.join(manifestDir, entry["file"])
+    return entries
+
+
+def _resolveApp(tokens, entry):
+    """Fills in the appId of an entry given by appTitle. Returns a failed RelevantResponse if that is not possible."""
+    if entry.get("appId"):
+        return None
+    try:
+        appId = tokens.call(api.resolveAppId, entry["appTitle"])
+    except api.IEMApiError as e:
+        return e.response
+    except Exception as e:
+        return api.RelevantResponse(False, -1, 'error', e)
+    if not appId:
+        return api.RelevantResponse(False, 404, "UnexpectedBehaviour", f"App {entry['appTitle']} not found in IEM catalog")
+    entry["appId"] = appId
+    return None
+
+
+def _fetchConfigs(tokens, appId):
+    """Returns (appId, {displayName: config}), or (appId, failed RelevantResponse)."""
+    try:
+        response = tokens.call(api.getAllConfigurationsOfApp, appId)
+    except Exception as e:
+        response = api.RelevantResponse(False, -1, 'error', e)
+    if not response.success:
+        return appId, response
+    return appId, {x['displayName']: x for x in response.content}
+
+
+def _digest(entry):
+    try:
+        return api.fileSha256(entry["path"])
+    except OSError as e:
+        return api.RelevantResponse(False, -1, 'error', e)
+
+
+def planSync(tokens, entries, workers=8):
+    """
+    Short: Diff a manifest against the IEM
+    Description: Fetches the configuration listing of every app once and returns (action, entry, config) tuples with
+    action "create" (configuration missing), "upload" (content differs from the newest version) or "unchanged".
+    Entries that cannot be planned (unknown app, failed listing, unreadable file) get action "failed" with the failed
+    RelevantResponse in place of the config.
+    """
+    plan = []
+    resolved = []
+    for entry in entries:
+        error = _resolveApp(tokens, entry)
+        if error is None:
+            resolved.append(entry)
+        else:
+            plan.append(("failed", entry, error))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        configsByApp = dict(pool.map(lambda appId: _fetchConfigs(tokens, appId),
+                                     {entry["appId"] for entry in resolved}))
+        digests = list(pool.map(_digest, resolved))
+    for entry, digest in zip(resolved, digests):
+        configs = configsByApp[entry["appId"]]
+        error = next((x for x in (configs, digest) if isinstance(x, api.RelevantResponse)), None)
+        plan.append(("failed", entry, error) if error is not None else _planEntry(entry, digest, configs))
+    return plan
+
+
+def _planEntry(entry, digest, configs):
+    entry["sha256"] = digest
+    config = configs.get(entry["displayName"])
+    if config is None:
+        return "create", entry, None
+    versions = config.get('appConfigVersionLst') or []
+    latest = versions[0] if versions else None
+    if latest and f"{api.hashMarker}{digest}" in (latest.get('description') or ""):
+        return "unchanged", entry, config
+    return "upload", entry, config
+
+
+def _apply(tokens, action, entry, config):
+    start = time.perf_counter()
+    try:
+        result = _applyEntry(tokens, action, entry, config)
+    except Exception as e:
+        result = api.RelevantResponse(False, -1, 'error', e)
+    return entry, result, time.perf_counter() - start
+
+
+def _applyEntry(tokens, action, entry, config):
+    if action == "create":
+        created = tokens.call(api.addVersionedConfiguration,
+                              entry["appId"], entry)
+        if not created.success:
+            return created
+        appConfigId = created.content
+    else:
+        appConfigId = config['appConfigId']
+    return tokens.call(api.uploadConfigurationFile, entry["appId"], appConfigId,
+                       entry.get("referenceName") or entry["sha256"][:12],
+                       entry.get("versionDescription") or entry["description"], entry["path"],
+                       contentType=entry.get("contentType", "application/json"), skipIfUnchanged=False)
+
+
+def syncConfigurations(tokens, manifestDir, workers=8):
+    """
+    Short: Bring the configurations of many apps in line with a manifest directory
+    Description: Plans the sync with one listing per app, then creates and uploads only the changed configurations
+    concurrently on at most workers threads. Prints a summary and returns the number of failed entries.
+    : param tokens:      (TokenManager) token manager of the IEM [required]
+    : param manifestDir: (str) directory holding manifest.json and the configuration files [required]
+    : param workers:     (int) maximum number of concurrent requests [optional]
+    """
+    start = time.perf_counter()
+    plan = planSync(tokens, loadManifest(manifestDir), workers)
+    changes = [step for step in plan if step[0] in ("create", "upload")]
+    unplanned = [(entry, error, 0.0) for action, entry, error in plan if action == "failed"]
+    print(f"{len(changes)} of {len(plan)} configurations changed")
+    if unplanned:
+        print(f"{len(unplanned)} configurations could not be planned")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = unplanned + list(pool.map(lambda step: _apply(tokens, *step), changes))
+    failed = 0
+    for entry, result, duration in results:
+        outcome = "OK" if result.success else "FAILED"
+        app = entry.get("appId") or entry.get("appTitle")
+        print(f"{app:<38} {entry['displayName']:<30} {outcome:<8} {duration:>7.2f}s")
+        if not result.success:
+            failed += 1
+            print(f"    {result.content}")
+    print(
+        f"{len(results) - failed}/{len(results)} configurations updated in {time.perf_counter() - start:.2f}s")
+    return failed
@@ -0,0 +1,116 @@
+import csv
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import iem_functions_api as api
+
+
+def _value(text):
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _nest(row):
+    """Turns flat CSV columns such as "device.name" into nested dicts."""
+    definition = {}
+    for key, text in row.items():
+        if key is None or text is None or text == "":
+            continue
+        target = definition
+        parts = key.split(".")
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+        target[parts[-1]] = _value(text)
+    return definition
+
+
+def loadDeviceDefinitions(path):
+    """
+    Short: Read IED definitions
+    Description: Reads a JSON list of device create payloads, or a CSV file with one device per row whose dotted
+    column names (e.g. "device.name") are expanded into nested objects.
+    """
+    with open(path, newline="") as f:
+        if path.lower().endswith(".csv"):
+            return [_nest(row) for row in csv.DictReader(f)]
+        return json.load(f)
+
+
+def deviceNameOf(definition):
+    return definition.get("deviceName") or definition.get("name") or (definition.get("device") or {}).get("name")
+
+
+def onboardingFileName(name, index):
+    """File name of the onboarding file of a device: its name reduced to safe characters, or its position."""
+    safe = re.sub(r"[^A-Za-z0-9._-]", "_", str(name)).strip(".")
+    return f"{safe or f'device-{index}'}.json"
+
+
+def _create(tokens, definition, outputDir, index):
+    name = deviceNameOf(definition)
+    if not name:
+        # without a name the device cannot be found again to wait for its activation
+        return f"#{index}", api.RelevantResponse(False, -1, 'error', "Definition has no device name"), 0.0
+    start = time.perf_counter()
+    try:
+        result = tokens.call(api.createDeviceInMyEdgeCoresToFile, definition,
+                             os.path.join(outputDir, onboardingFileName(name, index)))
+    except Exception as e:
+        result = api.RelevantResponse(False, -1, 'error', e)
+    return name, result, time.perf_counter() - start
+
+
+def onboardDevices(tokens, definitions, outputDir, workers=8):
+    """
+    Short: Create many devices concurrently
+    Description: Creates every definition on at most workers threads and writes each onboarding file to
+    outputDir/<deviceName>.json (see onboardingFileName) as soon as it arrives. Returns the names of the devices that
+    were created.
+    """
+    os.makedirs(outputDir, exist_ok=True)
+    created = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_create, tokens, definition, outputDir, index)
+                   for index, definition in enumerate(definitions)]
+        for future in as_completed(futures):
+            name, result, duration = future.result()
+            if result.success:
+                created.append(name)
+                print(f"{name:<30} created     {duration:>7.2f}s  {result.content}")
+            else:
+                print(f"{name:<30} FAILED      {duration:>7.2f}s  {result.content}")
+    print(f"{len(created)}/{len(definitions)} devices created")
+    return created
+
+
+def waitForActivation(tokens, deviceNames, interval=15, timeout=1800):
+    """
+    Short: Wait until devices are activated
+    Description: Polls the device list once per interval for the whole set, instead of once per device, until every
+    device confirmed its activation or the timeout expired. Returns the names that are still not activated.
+    """
+    pending = set(deviceNames)
+    deadline = time.time() + timeout
+    while pending:
+        try:
+            result = tokens.call(api.getActivationStatusOfDevices, pending)
+        except Exception as e:
+            result = api.RelevantResponse(False, -1, 'error', e)
+        if result.success:
+            activated = {name for name, isActivated in result.content.items() if isActivated}
+            for name in sorted(activated):
+                print(f"{name} activated")
+            pending -= activated
+        else:
+            print(f"Activation status unavailable: {result.content}")
+        if not pending or time.time() + interval > deadline:
+            break
+        print(f"{len(pending)} devices waiting for activation")
+        time.sleep(interval)
+    for name in sorted(pending):
+        print(f"{name} not activated")
+    return pending
@@ -0,0 +1,211 @@
+import asyncio
+import json
+from iem_functions_api import RelevantResponse, IEMApiError, baseUrl, devUrl, defaultMaxBatchSize, defaultPageSize, _deviceList, _chunks, _lastPage
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is only needed by the async client
+    aiohttp = None
+
+
+async def gatherOrCancel(*aws):
+    """
+    Short: Run awaitables concurrently with structured cancellation
+    Description: Like asyncio.gather, but if one awaitable raises (or the caller is cancelled), every other one that
+    is still running is cancelled and awaited before the exception propagates.
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class AsyncIEMClient:
+    """
+    Short: Asynchronous client for one IEM
+    Description: Async counterpart of iem_functions_api for orchestrating many IEDs from one event loop. Every request
+    of the client is bounded by one semaphore, so one IEM never sees more than maxConcurrency requests at a time.
+    The methods take the same arguments as the sync functions, without iemUrl, and return RelevantResponse objects.
+    Use it as "async with AsyncIEMClient(url) as iem:".
+    : param iemUrl:         (str) the address of iem [required]
+    : param maxConcurrency: (int) maximum number of requests in flight to this IEM [optional]
+    : param verify:         (bool) verify the TLS certificate of the IEM [optional]
+    : param timeout:        (float) total timeout of one request in seconds [optional]
+    """
+
+    def __init__(self, iemUrl, maxConcurrency=20, verify=False, timeout=60):
+        if aiohttp is None:
+            raise ImportError("AsyncIEMClient requires aiohttp (pip install -r requirements-async.txt)")
+        self.iemUrl = iemUrl
+        self.maxConcurrency = maxConcurrency
+        self.verify = verify
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(maxConcurrency)
+        self._session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit_per_host=self.maxConcurrency, ssl=None if self.verify else False)
+        self._session = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method, url, **kwargs):
+        async with self._semaphore:
+            async with self._session.request(method, url, **kwargs) as response:
+                text = await response.text()
+        try:
+            body = json.loads(text) if text else None
+        except ValueError:
+            body = None
+        return response.status, body, text
+
+    async def _call(self, method, url, contentName, extract, errorName="Error Message", **kwargs):
+        try:
+            status, body, text = await self._request(method, url, **kwargs)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f'Unexpected error: {e}')
+            return RelevantResponse(False, -1, 'error', e)
+        if status == 200:
+            try:
+                return RelevantResponse(True, str(status), contentName, extract(body) if body is not None else text)
+            except (KeyError, IndexError, TypeError, AttributeError) as e:
+                print(f'Unexpected response: {e!r}')
+                return RelevantResponse(False, -1, 'error', e)
+        try:
+            message = body['errors'][0]['message']
+        except (KeyError, IndexError, TypeError):
+            message = text
+        return RelevantResponse(False, str(status), errorName, message)
+
+    @staticmethod
+    def _headers(bearertoken=None, contentType='application/json'):
+        headers = {}
+        if contentType:
+            headers['Content-Type'] = contentType
+        if bearertoken:
+            headers['Authorization'] = bearertoken
+        return headers
+
+    @staticmethod
+    def _infoMap(deviceIds):
+        writer = aiohttp.MultipartWriter("form-data")
+        part = writer.append(str({"devices": _deviceList(deviceIds)}))
+        part.set_content_disposition("form-data", name="infoMap")
+        return writer
+
+    async def loginDirect(self, username, password):
+        return await self._call("POST", f"{self.iemUrl}{baseUrl}/login/direct", "bearertoken",
+                                lambda body: body['data']['access_token'],
+                                headers=self._headers(), json={"username": username, "password": password})
+
+    async def logout(self, bearertoken):
+        return await self._call("GET", f"{self.iemUrl}{devUrl}/logout", "Status", lambda body: "Logout was successful.",
+                                "UnexpectedBehaviour", headers=self._headers(bearertoken))
+
+    async def listApps(self, bearertoken):
+        return await self._call("GET", f"{self.iemUrl}{baseUrl}/applications", "Apps list", lambda body: body['data'],
+                                headers=self._headers(bearertoken))
+
+    async def listIEDs(self, bearerToken, size="", page=""):
+        query = {}
+        if size:
+            query["size"] = size
+        if page:
+            query["page"] = page
+        return await self._call("GET", f"{self.iemUrl}{baseUrl}/devices", "List", lambda body: body['data'],
+                                headers=self._headers(bearerToken), params=query)
+
+    async def iterIEDs(self, bearerToken, pageSize=defaultPageSize, startPage=1):
+        """Async generator over every device, one page at a time."""
+        page = startPage
+        while True:
+            result = await self._call("GET", f"{self.iemUrl}{baseUrl}/devices", "List", lambda body: body,
+                                      headers=self._headers(bearerToken), params={"size": pageSize, "page": page})
+            if not result.success:
+                raise IEMApiError(result)
+            items = result.content.get("data") or []
+            for device in items:
+                yield device
+            if _lastPage(items, result.content.get("page") or {}, page):
+                return
+            page += 1
+
+    async def listIEDApps(self, bearerToken, deviceID):
+        return await self._call("GET", f"{self.iemUrl}{baseUrl}/devices/installed-apps", "Installed Apps",
+                                lambda body: body['data'], headers=self._headers(bearerToken), params={"deviceid": deviceID})
+
+    async def _appBatch(self, bearertoken, command, deviceids, appid, schedule, contentName, errorName):
+        query = {"appid": appid, "operation": command}
+        if schedule:
+            query["schedule"] = schedule
+        return await self._call("POST", f"{self.iemUrl}{baseUrl}/batches", contentName, lambda body: body['data'],
+                                errorName, headers=self._headers(bearertoken, None), params=query,
+                                data=self._infoMap(deviceids))
+
+    async def installAppWithoutConf(self, bearertoken, deviceid, appid, schedule=""):
+        return await self._appBatch(bearertoken, "installApplication", deviceid, appid, schedule,
+                                    "Install App without Conf Batch ID", "Install App without Conf Error")
+
+    async def uninstallApp(self, bearertoken, deviceid, appid, schedule=""):
+        return await self._appBatch(bearertoken, "uninstallApplication", deviceid, appid, schedule,
+                                    "Uninstall App Batch ID", "Uninstall App Error")
+
+    async def _postDeployBatch(self, bearertoken, appId, appVersionId, deviceIds, contentName, extract):
+        url = f"{self.iemUrl}{devUrl}/applications/{appId}/versions/{appVersionId}/batch?operation=installApplication&isRetainSecret=false&allow=true"
+        return await self._call("POST", url, contentName, extract, "UnexpectedBehaviour",
+                                headers=self._headers(bearertoken, None), data=self._infoMap(deviceIds))
+
+    async def deployAppToIED(self, bearertoken, appId, appVersionId, deviceId):
+        return await self._postDeployBatch(bearertoken, appId, appVersionId, deviceId, "Status",
+                                           lambda body: "Application Download was triggered.")
+
+    async def deployAppToIEDs(self, bearertoken, appId, appVersionId, deviceIds, maxBatchSize=defaultMaxBatchSize):
+        chunks = list(_chunks(deviceIds, maxBatchSize))
+        results = await gatherOrCancel(*(self._postDeployBatch(bearertoken, appId, appVersionId, chunk, "Batch",
+                                                               lambda body: body.get('data'))
+                                         for chunk in chunks))
+        return list(zip(chunks, results))
+
+    async def deleteApp(self, bearertoken, app_id):
+        return await self._call("DELETE", f"{self.iemUrl}{devUrl}/dev-apps/{app_id}", "Deleted App",
+                                lambda body: body['data'], "Deleted App Error", headers=self._headers(bearertoken))
+
+    async def addVersionedConfiguration(self, bearertoken, appId, configuration):
+        payload = {
+            "displayName": configuration['displayName'],
+            "description": configuration['description'],
+            "volPath": configuration['volPath'],
+            "relativePath": configuration['relativePath'],
+            "secured": "false",
+            "versioned": "true"
+        }
+        return await self._call("POST", f"{self.iemUrl}{devUrl}/applications/{appId}/configs", "configId",
+                                lambda body: body['data']['appConfigId'], "UnexpectedBehaviour",
+                                headers=self._headers(bearertoken), json=payload)
+
+    async def uploadJsonAsConfigurationFile(self, bearertoken, appId, appConfigId, appConfig):
+        configversion = {
+            "refName": appConfig['referenceName'],
+            "description": appConfig['description']
+        }
+        form = aiohttp.FormData()
+        form.add_field('configversion', str(configversion))
+        form.add_field('filename', str(appConfig['filename']))
+        form.add_field('file', str(appConfig['content']), filename=str(appConfig['filename']),
+                       content_type='application/json')
+        return await self._call("POST", f"{self.iemUrl}{devUrl}/applications/{appId}/configs/{appConfigId}/versions",
+                                "Status", lambda body: "Upload was successful.", "UnexpectedBehaviour",
+                                headers=self._headers(bearertoken, None), data=form)
@@ -0,0 +1,218 @@
+"""
+Local daemon that keeps api_handler warm between invocations.
+
+Start it once per runner with `python iem_daemon.py start &`. While its socket exists, `python api_handler.py ...`
+forwards the command line to it instead of running it in a new process, so the IEM connections, tokens and name
+cache of earlier runs are reused. `python iem_daemon.py stop` shuts it down. Set IEM_NO_DAEMON=1 to bypass it.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+import traceback
+
+# Environment variables a command may read, sent along with its command line
+forwardedEnv = ("IE_", "IED_", "APP_", "GITHUB_")
+
+
+def defaultSocketPath():
+    return os.environ.get("IEM_DAEMON_SOCKET") or os.path.join(
+        tempfile.gettempdir(), f"iem-daemon-{os.getuid()}.sock")
+
+
+def _send(path, request, onOutput=None):
+    """Sends one request and returns the final {"exitCode"} message, passing streamed output to onOutput."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as reader:
+            for line in reader:
+                message = json.loads(line)
+                if "exitCode" in message:
+                    return message
+                if onOutput:
+                    onOutput(message["output"])
+    finally:
+        sock.close()
+    return None
+
+
+def forward(argv, path=None):
+    """
+    Short: Run a command line in the daemon
+    Description: Sends argv with the working directory and the IEM related environment to the daemon, prints its
+    output while the command runs and returns the exit code. Returns None if no daemon is listening on path.
+    """
+    path = path or defaultSocketPath()
+    if not os.path.exists(path):
+        return None
+    request = {"argv": list(argv), "cwd": os.getcwd(),
+               "env": {key: value for key, value in os.environ.items() if key.startswith(forwardedEnv)}}
+    received = []
+
+    def write(output):
+        received.append(output)
+        sys.stdout.write(output)
+        sys.stdout.flush()
+
+    try:
+        response = _send(path, request, write)
+    except (OSError, ValueError):
+        response = None
+    if response is None:
+        # the daemon went away; only run the command locally if it has not started writing output
+        return 1 if received else None
+    return response["exitCode"]
+
+
+@contextlib.contextmanager
+def _environment(env, cwd):
+    """Applies the environment and working directory of a client for the duration of one run."""
+    saved = {key: value for key, value in os.environ.items() if key.startswith(forwardedEnv)}
+    savedCwd = os.getcwd()
+    for key in saved:
+        del os.environ[key]
+    os.environ.update(env)
+    if cwd:
+        os.chdir(cwd)
+    try:
+        yield
+    finally:
+        os.chdir(savedCwd)
+        for key in [key for key in os.environ if key.startswith(forwardedEnv)]:
+            del os.environ[key]
+        os.environ.update(saved)
+
+
+class _StreamWriter(io.TextIOBase):
+    """Text stream sending every write to the client as an {"output"} message. A client that hung up is ignored."""
+
+    def __init__(self, wfile):
+        self._wfile = wfile
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if text:
+            self.send({"output": text})
+        return len(text)
+
+    def send(self, message):
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._wfile.write(json.dumps(message).encode() + b"\n")
+                self._wfile.flush()
+            except OSError:
+                self._closed = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        request = json.loads(line)
+        writer = _StreamWriter(self.wfile)
+        if request.get("shutdown"):
+            writer.send({"exitCode": 0})
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+            return
+        writer.send({"exitCode": self.server.run(request, writer)})
+
+
+class IEMDaemon(socketserver.ThreadingUnixStreamServer):
+    """
+    Short: Unix socket server running api_handler command lines in one process
+    Description: Every connection sends one JSON request {"argv", "cwd", "env"} and receives the output of the run as
+    {"output"} lines while it is written, followed by one {"exitCode"} line.
+    Runs are serialized behind a lock because api_handler keeps its options, stdout and working directory
+    process-wide. The socket is only accessible by the user running the daemon.
+    : param path: (str) path of the Unix socket [optional]
+    """
+    daemon_threads = True
+
+    def __init__(self, path=None):
+        self.path = path or defaultSocketPath()
+        self._lock = threading.Lock()
+        if os.path.exists(self.path):
+            try:
+                with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+                    probe.connect(self.path)
+            except OSError:
+                os.remove(self.path)
+            else:
+                raise RuntimeError(f"An IEM daemon is already listening on {self.path}")
+        umask = os.umask(0o177)
+        try:
+            super().__init__(self.path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def run(self, request, output):
+        import api_handler
+        with self._lock, _environment(request.get("env") or {}, request.get("cwd")), \
+                contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            try:
+                exitCode = api_handler.main(request["argv"], persistent=True) or 0
+            except SystemExit as e:
+                if e.code is None or isinstance(e.code, int):
+                    exitCode = e.code or 0
+                else:
+                    print(e.code)
+                    exitCode = 1
+            except Exception:
+                traceback.print_exc()
+                exitCode = 1
+        return exitCode
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["start", "stop"])
+    parser.add_argument("--socket", default=defaultSocketPath(),
+                        help="path of the Unix socket")
+    args = parser.parse_args(argv)
+
+    if args.command == "stop":
+        try:
+            _send(args.socket, {"shutdown": True})
+        except OSError:
+            print(f"No IEM daemon is listening on {args.socket}")
+            return 1
+        return 0
+
+    server = IEMDaemon(args.socket)
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown, daemon=True).start())
+    print(f"IEM daemon listening on {server.path}")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,139 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import iem_functions_api as api
+from iem_models import App, Device
+from token_manager import getTokenManager
+
+
+class IEMEndpoint:
+    def __init__(self, name, url, username, password, poolMaxsize=10):
+        self.name = name
+        self.url = url
+        self.username = username
+        self.password = password
+        self.poolMaxsize = poolMaxsize
+
+
+def loadEndpoints(path):
+    """
+    Short: Read the IEM endpoints of a federation
+    Description: JSON list of {"name", "url", "username", "password" or "passwordEnv", "poolMaxsize" (optional)}.
+    "passwordEnv" names an environment variable holding the password, so that the file can be committed.
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    return [IEMEndpoint(entry.get("name") or entry["url"], entry["url"], entry["username"],
+                        entry.get("password") or os.environ[entry["passwordEnv"]], entry.get("poolMaxsize", 10))
+            for entry in entries]
+
+
+class FleetResult:
+    def __init__(self, iem, success, content):
+        self.iem = iem
+        self.success = success
+        self.content = content
+
+
+class FederatedClient:
+    """
+    Short: Run IEM operations across several management servers
+    Description: Gives every IEM its own pooled client and token manager, and runs list, resolve and deploy
+    operations on all of them concurrently. Results are merged into one fleet view; a failing IEM is reported in the
+    results instead of aborting the operation on the others.
+    : param endpoints:     (list) IEMEndpoint of every IEM [required]
+    : param tokenCacheDir: (str) directory the tokens are cached in between runs [optional]
+    """
+
+    def __init__(self, endpoints, tokenCacheDir=None):
+        self.endpoints = list(endpoints)
+        self.tokens = {}
+        for endpoint in self.endpoints:
+            api.configureClient(endpoint.url, poolMaxsize=endpoint.poolMaxsize)
+            cacheFile = os.path.join(tokenCacheDir, f"{endpoint.name}.token") if tokenCacheDir else None
+            self.tokens[endpoint.name] = getTokenManager(
+                endpoint.url, endpoint.username, endpoint.password, cacheFile=cacheFile)
+
+    def fanOut(self, operation, endpoints=None):
+        """Calls operation(endpoint, tokenManager) for every IEM concurrently and returns a FleetResult per IEM."""
+        endpoints = self.endpoints if endpoints is None else endpoints
+
+        def run(endpoint):
+            try:
+                return FleetResult(endpoint.name, True, operation(endpoint, self.tokens[endpoint.name]))
+            except Exception as e:
+                return FleetResult(endpoint.name, False, e)
+
+        if not endpoints:
+            return []
+        with ThreadPoolExecutor(max_workers=len(endpoints)) as pool:
+            return list(pool.map(run, endpoints))
+
+    def listDevices(self):
+        """Returns (fleet, failures): a list of (iem name, Device) over all IEMs, and the FleetResults that failed."""
+        results = self.fanOut(lambda endpoint, tokens: tokens.call(
+            lambda url, token: list(api.iterIEDs(url, token, prefetch=True, model=Device, stream=True))))
+        fleet = [(result.iem, device) for result in results if result.success for device in result.content]
+        return fleet, [result for result in results if not result.success]
+
+    def listApps(self):
+        results = self.fanOut(lambda endpoint, tokens: tokens.call(
+            lambda url, token: list(api.iterApps(url, token, prefetch=True, model=App, stream=True))))
+        apps = [(result.iem, app) for result in results if result.success for app in result.content]
+        return apps, [result for result in results if not result.success]
+
+    def resolveDevices(self, deviceNames):
+        """
+        Short: Find devices across the fleet
+        Description: Returns (found, missing): found maps deviceName -> (iem name, deviceId). If a name exists on
+        several IEMs, the first endpoint in configuration order wins.
+        """
+        wanted = list(deviceNames)
+        results = self.fanOut(lambda endpoint, tokens: {name: tokens.call(api.resolveDeviceId, name)
+                                                        for name in wanted})
+        order = {endpoint.name: i for i, endpoint in enumerate(self.endpoints)}
+        found = {}
+        for result in sorted(results, key=lambda r: order[r.iem]):
+            if not result.success:
+                print(f"Resolving devices on {result.iem} failed: {result.content}")
+                continue
+            for name, deviceId in result.content.items():
+                if deviceId and name not in found:
+                    found[name] = (result.iem, deviceId)
+        return found, [name for name in wanted if name not in found]
+
+    def deploy(self, appTitle, versionNumber, deviceNames, batchSize=api.defaultMaxBatchSize):
+        """
+        Short: Deploy an app version to devices on any IEM
+        Description: Resolves every device to its IEM, then on each IEM concurrently resolves the app and version
+        ids (they differ between IEMs) and submits multi-device batches. Returns (results, missing) where results is
+        a FleetResult per IEM whose content is the deployAppToIEDs result list.
+        """
+        found, missing = self.resolveDevices(deviceNames)
+        return self.deployResolved(appTitle, versionNumber, found, batchSize), missing
+
+    def deployResolved(self, appTitle, versionNumber, found, batchSize=api.defaultMaxBatchSize):
+        """Like deploy, for devices already resolved with resolveDevices. Returns a FleetResult per IEM."""
+        byIem = {}
+        for name, (iem, deviceId) in found.items():
+            byIem.setdefault(iem, []).append(deviceId)
+
+        def deployOn(endpoint, tokens):
+            appId = tokens.call(api.resolveAppId, appTitle)
+            if not appId:
+                raise ValueError(f"App {appTitle} not found")
+            versions = tokens.call(api.getAppVersions, appId)
+            if not versions.success:
+                raise api.IEMApiError(versions)
+            versionId = next((v["versionId"] for v in versions.content
+                              if str(v["versionNumber"]) == str(versionNumber)), None)
+            if versionId is None:
+                raise ValueError(f"Version {versionNumber} of {appTitle} not found")
+            return tokens.call(api.deployAppToIEDs, appId, versionId, byIem[endpoint.name], batchSize)
+
+        targets = [endpoint for endpoint in self.endpoints if endpoint.name in byIem]
+        return self.fanOut(deployOn, targets)
+
+    def close(self):
+        for tokens in self.tokens.values():
+            tokens.close()
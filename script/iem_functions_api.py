@@ -1,14 +1,26 @@
 import os
-import requests
-from requests_toolbelt import MultipartEncoder
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import time
+import hashlib
 import json
-import urllib3
 import sys
+from resolver_cache import ResolverCache
+from iem_policy import CallPolicy
+import iem_metrics
+from iem_metrics import instrumented
+from urllib.parse import urlsplit, urlunsplit
+from iem_models import Device, App, InstalledApp
 
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+try:
+    import ijson
+except ImportError:  # ijson is only needed for streaming listings
+    ijson = None
 
 
 class RelevantResponse:
+    __slots__ = ("success", "statusCode", "contentName", "content")
+
     def __init__(self, success, statusCode, contentName, content):
         self.success = success
         self.statusCode = statusCode
@@ -19,10 +31,315 @@ class RelevantResponse:
         return "The Response was successful: {0} \tStatus Code: {1}\tContent Name: {2} \tContent: {3}".format(self.success, self.statusCode, self.contentName, self.content)
 
 
+class IEMApiError(Exception):
+    """Raised by the streaming helpers, which cannot hand back a RelevantResponse, when the IEM rejects a request."""
+
+    def __init__(self, response):
+        super().__init__(str(response))
+        self.response = response
+
+
 baseUrl = "/portal/api/v1"
 devUrl = "/p.service/api/v4"
+defaultPageSize = 100
+# port of the device service that reports the activation status, used when the IEM url does not name a port
+activationPort = 9443
+
+
+def _requests():
+    """
+    Imports requests on first use. requests, requests_toolbelt and urllib3 make up most of the startup time of a
+    script, so they are only imported once a request is actually made.
+    """
+    import requests
+    import urllib3
+    global _insecureWarningsDisabled
+    if not _insecureWarningsDisabled:
+        urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+        _insecureWarningsDisabled = True
+    return requests
+
+
+_insecureWarningsDisabled = False
+
+
+class IEMClient:
+    """
+    Short: Pooled HTTP client for the IEM
+    Description: Owns one requests.Session whose connections are kept alive and reused between calls, so a rollout
+    pays the TCP+TLS handshake once per pooled connection instead of once per request.
+    : param poolConnections: (int) number of per-host connection pools to keep [optional]
+    : param poolMaxsize:     (int) maximum number of open connections kept per host [optional]
+    : param poolBlock:       (bool) wait for a free connection instead of opening an extra one when a host pool is full [optional]
+    : param keepAlive:       (bool) reuse connections between requests [optional]
+    : param verify:          (bool) verify the TLS certificate of the IEM [optional]
+    : param policy:          (CallPolicy) retry/rate-limit/circuit-breaker policy. Default: the shared module policy [optional]
+    """
+
+    def __init__(self, poolConnections=10, poolMaxsize=10, poolBlock=False, keepAlive=True, verify=False, policy=None):
+        self.policy = policy
+        self.poolConnections = poolConnections
+        self.poolMaxsize = poolMaxsize
+        self.poolBlock = poolBlock
+        self.keepAlive = keepAlive
+        self.verify = verify
+        self.settings = (poolConnections, poolMaxsize, poolBlock, keepAlive, verify, policy)
+        self.session = _requests().Session()
+        self.session.verify = verify
+        adapter = iem_metrics.InstrumentedHTTPAdapter(pool_connections=poolConnections,
+                                                      pool_maxsize=poolMaxsize, pool_block=poolBlock)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        if not keepAlive:
+            self.session.headers["Connection"] = "close"
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("verify", self.verify)
+        policy = self.policy or getPolicy()
+        attempts = [0]
+
+        def send():
+            attempts[0] += 1
+            return self.session.request(method, url, **kwargs)
+
+        requests = _requests()
+
+        def execute():
+            return policy.execute(urlsplit(url).netloc, method, send,
+                                  rewind=lambda: _rewindBody(kwargs),
+                                  connectErrors=_notConnected,
+                                  errors=(requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+        metrics = iem_metrics.metrics
+        if not metrics.enabled:
+            return execute()
+        iem_metrics.startRequest()
+        start = time.perf_counter()
+        response = None
+        try:
+            response = execute()
+            return response
+        finally:
+            total = time.perf_counter() - start
+            status, ttfb, bytesOut, bytesIn = "error", 0.0, 0, 0
+            if response is not None:
+                status = response.status_code
+                ttfb = response.elapsed.total_seconds()
+                bytesOut = int(response.request.headers.get(
+                    "Content-Length") or 0)
+                bytesIn = int(response.headers.get("Content-Length") or 0) if kwargs.get(
+                    "stream") else len(response.content)
+            metrics.record(iem_metrics.currentEndpoint(urlsplit(url).path), method.upper(), status,
+                           iem_metrics.connectSeconds(), ttfb, total, bytesOut, bytesIn, max(0, attempts[0] - 1))
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request("DELETE", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _notConnected(error):
+    """True if error was raised before the request reached the IEM: the connection could not be established."""
+    requests = _requests()
+    import urllib3
+    if isinstance(error, (requests.exceptions.ConnectTimeout, requests.exceptions.SSLError)):
+        return True
+    # a refused connection is a plain ConnectionError wrapping MaxRetryError(reason=NewConnectionError)
+    reason = error.args[0] if isinstance(error, requests.exceptions.ConnectionError) and error.args else None
+    return isinstance(getattr(reason, "reason", reason), urllib3.exceptions.NewConnectionError)
+
+
+def _rewindBody(kwargs):
+    """Prepares a request body to be sent again. Returns False if it is a stream that cannot be replayed."""
+    from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
+    data = kwargs.get("data")
+    if isinstance(data, MultipartEncoderMonitor):
+        inner = {"data": data.encoder}
+        if not _rewindBody(inner):
+            return False
+        kwargs["data"] = MultipartEncoderMonitor(inner["data"], data.callback)
+        return True
+    if isinstance(data, MultipartEncoder):
+        fields = data.fields.items() if isinstance(
+            data.fields, dict) else data.fields
+        for _, value in fields:
+            if isinstance(value, (tuple, list)) and hasattr(value[1], "read"):
+                if not (hasattr(value[1], "seekable") and value[1].seekable()):
+                    return False
+                value[1].seek(0)
+        kwargs["data"] = MultipartEncoder(
+            fields=data.fields, boundary=data.boundary_value)
+        return True
+    if hasattr(data, "read"):
+        if hasattr(data, "seekable") and data.seekable():
+            data.seek(0)
+            return True
+        return False
+    return True
+
+
+_policy = CallPolicy()
+
+
+def getPolicy():
+    return _policy
+
+
+def setPolicy(policy):
+    """
+    Short: Replace the shared request policy
+    Description: Sets the CallPolicy (retries, rate limit, circuit breaker) used by every client without its own policy.
+    : param policy: (CallPolicy) the policy to use [required]
+    """
+    global _policy
+    _policy = policy
+    return policy
+
+
+def policyStats():
+    return getPolicy().stats
+
+
+_clients = {}
+_clientsLock = threading.Lock()
+
+
+def _withPort(iemUrl, port):
+    """Returns iemUrl with port added, unless it already names one."""
+    parts = urlsplit(iemUrl.rstrip("/"))
+    if parts.port or not port:
+        return urlunsplit(parts)
+    return urlunsplit(parts._replace(netloc=f"{parts.netloc}:{port}"))
+
 
+def _hostKey(iemUrl):
+    return iemUrl.rstrip("/") if iemUrl else None
+
+
+def getClient(iemUrl=None):
+    """
+    Short: Get the pooled client used for an IEM
+    Description: Returns the client registered for iemUrl, or the shared default client (created on first use).
+    : param iemUrl: (str) the address of iem [optional]
+    """
+    key = _hostKey(iemUrl)
+    with _clientsLock:
+        client = _clients.get(key) or _clients.get(None)
+        if client is None:
+            client = IEMClient()
+            _clients[None] = client
+        return client
+
+
+def setClient(client, iemUrl=None):
+    """
+    Short: Register a pooled client
+    Description: Registers client for iemUrl, or as the default client for every IEM if iemUrl is not given.
+    The client that was registered before is closed.
+    : param client: (IEMClient) the client to use [required]
+    : param iemUrl: (str) the address of iem [optional]
+    """
+    key = _hostKey(iemUrl)
+    with _clientsLock:
+        previous = _clients.get(key)
+        _clients[key] = client
+    if previous is not None and previous is not client:
+        previous.close()
+    return client
 
+
+def configureClient(iemUrl=None, **kwargs):
+    """
+    Short: Replace the pooled client with a new configuration
+    Description: Shortcut for setClient(IEMClient(**kwargs), iemUrl). The registered client, with its open
+    connections, is kept if it already has this configuration.
+    """
+    client = IEMClient(**kwargs)
+    with _clientsLock:
+        current = _clients.get(_hostKey(iemUrl))
+    if current is not None and current.settings == client.settings:
+        client.close()
+        return current
+    return setClient(client, iemUrl)
+
+
+defaultMaxBatchSize = 100
+
+
+def _deviceList(deviceIds):
+    if isinstance(deviceIds, str):
+        return [deviceIds]
+    return list(deviceIds)
+
+
+def _chunks(items, size):
+    items = list(items)
+    size = max(1, int(size))
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _batchData(response):
+    try:
+        return response.json().get('data')
+    except ValueError:
+        return response.text
+
+
+resolverCache = ResolverCache()
+
+
+def setResolverCache(cache):
+    """
+    Short: Replace the name -> id resolver cache
+    Description: Sets the ResolverCache used by the resolve* and get*Id helpers, e.g. one with a longer ttl that is
+    persisted to a file between pipeline runs.
+    : param cache: (ResolverCache) the cache to use [required]
+    """
+    global resolverCache
+    resolverCache = cache
+    return cache
+
+
+def _errorMessage(response):
+    try:
+        return response.json()['errors'][0]['message']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return response.text
+
+
+def batchIdOf(data):
+    """Returns the batch id from the data of a batch submission, which is either the id itself or an object holding it."""
+    if isinstance(data, dict):
+        for key in ("batchId", "id", "jobId"):
+            if data.get(key):
+                return str(data[key])
+        return None
+    return str(data) if data else None
+
+
+def closeClients():
+    with _clientsLock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        client.close()
+
+
+@instrumented
 def loginDirect(iemUrl, username, password):
     """
     Short: Log in with username and password
@@ -47,8 +364,8 @@ def loginDirect(iemUrl, username, password):
     }
 
     try:
-        response = requests.post(url, headers=headers,
-                                 verify=False, json=payload, params=query)
+        response = getClient(iemUrl).post(url, headers=headers,
+                                          json=payload, params=query)
     except Exception as e:
         print(f'Unexpected error: {e}')
         return RelevantResponse(False, -1, 'error', e)
@@ -56,9 +373,10 @@ def loginDirect(iemUrl, username, password):
     if response.status_code == 200:
         return RelevantResponse(True, response.status_code, "bearertoken", response.json()['data']['access_token'])
     else:
-        return RelevantResponse(False, response.status_code, "Error Message", response.json()['errors'][0]['message'])
+        return RelevantResponse(False, response.status_code, "Error Message", _errorMessage(response))
 
 
+@instrumented
 def listApps(iem_url, bearertoken):
     """ Short: List apps.
     Description: This method returns a list of applications in catalog.
@@ -72,20 +390,178 @@ def listApps(iem_url, bearertoken):
     }
 
     try:
-        response = requests.get(url, headers=headers, verify=False)
+        response = getClient(iem_url).get(url, headers=headers)
         if response.status_code == 200:
             return RelevantResponse(True, str(response.status_code), "Apps list", response.json()['data'])
         else:
-            return RelevantResponse(False, str(response.status_code), "Apps list", response.json()['errors'][0]['message'])
+            return RelevantResponse(False, str(response.status_code), "Apps list", _errorMessage(response))
     except Exception as e:
         print(f'Unexpected error during list apps: {str(e)}')
         return RelevantResponse(False, -1, 'error', e)
 
 
+def _getPage(iemUrl, bearerToken, path, query, size, page, model=None, stream=False):
+    url = f"{iemUrl}{baseUrl}{path}"
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': bearerToken
+    }
+    query = dict(query or {})
+    query["size"] = size
+    query["page"] = page
+    stream = stream and ijson is not None
+
+    try:
+        response = getClient(iemUrl).get(url, headers=headers,
+                                         params=query, stream=stream)
+    except Exception as e:
+        raise IEMApiError(RelevantResponse(False, -1, 'error', e)) from e
+
+    with response:
+        if response.status_code != 200:
+            raise IEMApiError(RelevantResponse(
+                False, response.status_code, "Error Message", _errorMessage(response)))
+        if stream:
+            response.raw.decode_content = True
+            return _streamPage(response.raw, model)
+        body = response.json()
+    items = body.get("data") or []
+    if model:
+        items = [model.fromJson(x) for x in items]
+    return items, body.get("page") or {}
+
+
+def _streamPage(raw, model=None):
+    """Decodes a page item by item, so the raw page is never held as a whole, and collects the page metadata."""
+    items = []
+    info = {}
+    builder = None
+    for prefix, event, value in ijson.parse(raw):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == "data.item" and event in ("end_map", "end_array"):
+                items.append(model.fromJson(builder.value) if model else builder.value)
+                builder = None
+        elif prefix == "data.item":
+            if event in ("start_map", "start_array"):
+                builder = ijson.ObjectBuilder()
+                builder.event(event, value)
+            else:
+                items.append(value)
+        elif prefix.startswith("page.") and prefix.count(".") == 1 and event not in ("start_map", "start_array"):
+            info[prefix[len("page."):]] = value
+    return items, info
+
+
+def _lastPage(items, info, page):
+    """
+    Tells whether page was the last one of a listing. The page metadata decides if the IEM sends it, since the IEM may
+    return shorter pages than requested; otherwise only an empty page ends the listing.
+    """
+    if not items:
+        return True
+    if info.get("totalPages") is not None:
+        return page >= int(info["totalPages"])
+    if info.get("totalElements") is not None:
+        return page * int(info.get("size") or len(items)) >= int(info["totalElements"])
+    return False
+
+
+def iterPages(iemUrl, bearerToken, path, query=None, pageSize=defaultPageSize, startPage=1, prefetch=False, model=None,
+              stream=False, endpoint="listPaged"):
+    """
+    Short: Stream every item of a paged listing
+    Description: Generator that walks the pages of a portal API listing and yields the items one by one. At most the
+    current page (and, with prefetch, the next one) is held in memory, and the caller can stop iterating at any point.
+    Raises IEMApiError if a page cannot be fetched.
+    : param iemUrl:        (str) the address of iem [required]
+    : param bearerToken:    (str) the authorication token [required]
+    : param path:           (str) listing path below the portal api, e.g. "/devices" [required]
+    : param query:          (dict) additional query parameters [optional]
+    : param pageSize:       (int) the size of the page [optional]
+    : param startPage:      (int) the number of the first page [optional]
+    : param prefetch:       (bool) fetch the next page in the background while the current one is consumed [optional]
+    : param model:          (Record class) yield compact records of this iem_models class instead of dicts [optional]
+    : param stream:         (bool) decode pages incrementally with ijson, if installed [optional]
+    : param endpoint:       (str) name the page requests are counted under in the instrumentation [optional]
+    """
+    # labelled per call, because the pages are fetched while the caller iterates and on the prefetch thread
+    getPage = instrumented(_getPage, name=endpoint)
+    executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+    try:
+        page = startPage
+        pending = None
+        while True:
+            if pending is not None:
+                items, info = pending.result()
+            else:
+                items, info = getPage(
+                    iemUrl, bearerToken, path, query, pageSize, page, model, stream)
+            last = _lastPage(items, info, page)
+            pending = None
+            if executor and not last:
+                pending = executor.submit(
+                    getPage, iemUrl, bearerToken, path, query, pageSize, page + 1, model, stream)
+            yield from items
+            if last:
+                return
+            page += 1
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def iterIEDs(iemUrl, bearerToken, pageSize=defaultPageSize, prefetch=False, model=None, stream=False):
+    return iterPages(iemUrl, bearerToken, "/devices", pageSize=pageSize, prefetch=prefetch, model=model, stream=stream,
+                     endpoint="listIEDs")
+
+
+def iterApps(iemUrl, bearerToken, pageSize=defaultPageSize, prefetch=False, model=None, stream=False):
+    return iterPages(iemUrl, bearerToken, "/applications", pageSize=pageSize, prefetch=prefetch, model=model,
+                     stream=stream, endpoint="listApps")
+
+
+def iterIEDApps(iemUrl, bearerToken, deviceID=None, pageSize=defaultPageSize, prefetch=False, model=None, stream=False):
+    query = {"deviceid": deviceID} if deviceID else None
+    return iterPages(iemUrl, bearerToken, "/devices/installed-apps", query, pageSize=pageSize, prefetch=prefetch,
+                     model=model, stream=stream, endpoint="listIEDApps")
+
+
+def listIEDRecords(iemUrl, bearerToken, stream=False):
+    """
+    Short: List all Edge Devices as compact records
+    Description: Like listAllIEDs, but the content is a list of iem_models.Device records, which keep only the
+    fields the scripts use. With stream, pages are decoded incrementally (requires ijson).
+    """
+    try:
+        devices = list(iterIEDs(iemUrl, bearerToken, prefetch=True, model=Device, stream=stream))
+    except IEMApiError as e:
+        return e.response
+    return RelevantResponse(True, 200, "List", devices)
+
+
+def listIEDAppRecords(iemUrl, bearerToken, deviceID=None, stream=False):
+    """
+    Short: List installed apps as compact records
+    Description: Lists the apps installed on one device (or on all devices if deviceID is not given) as
+    iem_models.InstalledApp records.
+    """
+    try:
+        apps = list(iterIEDApps(iemUrl, bearerToken, deviceID, prefetch=True, model=InstalledApp, stream=stream))
+    except IEMApiError as e:
+        return e.response
+    return RelevantResponse(True, 200, "Installed Apps", apps)
+
+
 def listAllIEDs(iemUrl, bearertoken):
-    return listIEDs(iemUrl, bearertoken, 100, 1)
+    try:
+        devices = list(iterIEDs(iemUrl, bearertoken, prefetch=True))
+    except IEMApiError as e:
+        return e.response
+    return RelevantResponse(True, 200, "List", devices)
 
 
+@instrumented
 def listIEDs(iemUrl, bearerToken, size="", page=""):
     """
     Short: List Edge Devices
@@ -112,8 +588,8 @@ def listIEDs(iemUrl, bearerToken, size="", page=""):
         query["page"] = page
 
     try:
-        response = requests.get(url, headers=headers,
-                                verify=False, json=payload, params=query)
+        response = getClient(iemUrl).get(url, headers=headers,
+                                         json=payload, params=query)
     except Exception as e:
         print(f'Unexpected error: {e}')
         return RelevantResponse(False, -1, 'error', e)
@@ -121,15 +597,16 @@ def listIEDs(iemUrl, bearerToken, size="", page=""):
     if response.status_code == 200:
         return RelevantResponse(True, response.status_code, "List", response.json()["data"])
     else:
-        return RelevantResponse(False, response.status_code, "Error Message", response.json()['errors'][0]['message'])
+        return RelevantResponse(False, response.status_code, "Error Message", _errorMessage(response))
 
 
+@instrumented
 def installAppWithoutConf(iem_url, bearertoken, deviceid, appid, schedule=""):
     """ Short: Install App without any configuration.
     Description: This method install an application without config and return the batch ID of the operation.
     : param iem_url:  (str) address of IEM [required]
     : param bearertoken:  (str) auth token, obtained via login [required]
-    : param deviceid:  (str) unique id of device where the app command is executed [required]
+    : param deviceid:  (str|list) unique id of device where the app command is executed, or a list of ids [required]
     : param appid:  (str) unique app id [required]
     : param schedule: (str) Time in ticks,Unix Time in Microseconds UTC [optional]
     """
@@ -141,24 +618,70 @@ def installAppWithoutConf(iem_url, bearertoken, deviceid, appid, schedule=""):
     }
     if schedule:
         query["schedule"] = schedule
-    infomap = {"devices": [deviceid]}
+    infomap = {"devices": _deviceList(deviceid)}
+    from requests_toolbelt import MultipartEncoder
     m = MultipartEncoder({"infoMap": str(infomap)})
     headers = {
         'Authorization': bearertoken,
         'Content-Type': m.content_type,
     }
     try:
-        response = requests.post(url, headers=headers,
-                                 verify=False, params=query, data=m)
+        response = getClient(iem_url).post(url, headers=headers,
+                                           params=query, data=m)
         if response.status_code == 200:
             return RelevantResponse(True, str(response.status_code), "Install App without Conf Batch ID", response.json()['data'])
         else:
-            return RelevantResponse(False, str(response.status_code), "Install App without Conf Error", response.json()['errors'][0]['message'])
+            return RelevantResponse(False, str(response.status_code), "Install App without Conf Error", _errorMessage(response))
     except Exception as e:
         print(f'Unexpected error during app command: {str(e)}')
         return RelevantResponse(False, -1, 'error', e)
 
 
+def installAppWithoutConfOnIEDs(iem_url, bearertoken, deviceids, appid, schedule="", maxBatchSize=defaultMaxBatchSize):
+    """ Short: Install App without any configuration on many devices.
+    Description: This method installs an application on a set of devices with one batch per maxBatchSize devices.
+    Returns a list of (device ids, RelevantResponse) tuples, one per submitted batch.
+    : param iem_url:  (str) address of IEM [required]
+    : param bearertoken:  (str) auth token, obtained via login [required]
+    : param deviceids:  (list) unique ids of the devices [required]
+    : param appid:  (str) unique app id [required]
+    : param schedule: (str) Time in ticks,Unix Time in Microseconds UTC [optional]
+    : param maxBatchSize: (int) maximum number of devices per batch [optional]
+    """
+    return [(chunk, installAppWithoutConf(iem_url, bearertoken, chunk, appid, schedule))
+            for chunk in _chunks(deviceids, maxBatchSize)]
+
+
+@instrumented
+def getBatchStatus(iemUrl, bearerToken, batchId):
+    """
+    Short: Get batch status
+    Description: This method returns the status of a batch operation and of its per-device jobs.
+    : param iemUrl:        (str) the address of iem [required]
+    : param bearerToken:    (str) the authorication token [required]
+    : param batchId:        (str) id of the batch [required]
+    """
+
+    url = f"{iemUrl}{baseUrl}/batches/{batchId}"
+
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': bearerToken
+    }
+
+    try:
+        response = getClient(iemUrl).get(url, headers=headers)
+    except Exception as e:
+        print(f'Unexpected error: {e}')
+        return RelevantResponse(False, -1, 'error', e)
+
+    if response.status_code == 200:
+        return RelevantResponse(True, response.status_code, "Batch Status", response.json()["data"])
+    else:
+        return RelevantResponse(False, response.status_code, "Error Message", _errorMessage(response))
+
+
+@instrumented
 def listIEDApps(iemUrl, bearerToken, deviceID):
     """
     Short: List Edge Device apps
@@ -182,8 +705,8 @@ def listIEDApps(iemUrl, bearerToken, deviceID):
     }
 
     try:
-        response = requests.get(url, headers=headers,
-                                verify=False, json=payload, params=query)
+        response = getClient(iemUrl).get(url, headers=headers,
+                                         json=payload, params=query)
     except Exception as e:
         print(f'Unexpected error: {e}')
         return RelevantResponse(False, -1, 'error', e)
@@ -191,15 +714,16 @@ def listIEDApps(iemUrl, bearerToken, deviceID):
     if response.status_code == 200:
         return RelevantResponse(True, response.status_code, "Installed Apps", response.json()["data"])
     else:
-        return RelevantResponse(False, response.status_code, "Error Message", response.json()['errors'][0]['message'])
+        return RelevantResponse(False, response.status_code, "Error Message", _errorMessage(response))
 
 
+@instrumented
 def uninstallApp(iem_url, bearertoken, deviceid, appid, schedule=""):
     """ Short: Uninstall app.
     Description: This method uninstalls an application from the specified device,return the batch ID of the operation.
     : param iem_url:  (str) address of IEM [required]
     : param bearertoken:  (str) auth token, obtained via login [required]
-    : param deviceid:  (str) unique id of device where the app command is executed [required]
+    : param deviceid:  (str|list) unique id of device where the app command is executed, or a list of ids [required]
     : param appid:  (str) unique app id [required]
     : param schedule: (str) Time in ticks,Unix Time in Microseconds UTC [optional]
     """
@@ -212,39 +736,61 @@ def uninstallApp(iem_url, bearertoken, deviceid, appid, schedule=""):
     if schedule:
         query["schedule"] = schedule
 
-    infomap = {"devices": [deviceid],
+    infomap = {"devices": _deviceList(deviceid),
                }
+    from requests_toolbelt import MultipartEncoder
     m = MultipartEncoder({"infoMap": str(infomap)})
     headers = {
         'Authorization': bearertoken,
         'Content-Type': m.content_type,
     }
     try:
-        response = requests.post(url, headers=headers,
-                                 verify=False, params=query, data=m)
+        response = getClient(iem_url).post(url, headers=headers,
+                                           params=query, data=m)
         if response.status_code == 200:
             return RelevantResponse(True, str(response.status_code), "Uninstall App Batch ID", response.json()['data'])
         else:
-            return RelevantResponse(False, str(response.status_code), "Uninstall App Error", response.json()['errors'][0]['message'])
+            return RelevantResponse(False, str(response.status_code), "Uninstall App Error", _errorMessage(response))
     except Exception as e:
         print(f'Unexpected error during app command: {str(e)}')
         return RelevantResponse(False, -1, 'error', e)
 
 
+def uninstallAppFromIEDs(iem_url, bearertoken, deviceids, appid, schedule="", maxBatchSize=defaultMaxBatchSize):
+    """ Short: Uninstall app from many devices.
+    Description: This method uninstalls an application from a set of devices with one batch per maxBatchSize devices.
+    Returns a list of (device ids, RelevantResponse) tuples, one per submitted batch.
+    : param iem_url:  (str) address of IEM [required]
+    : param bearertoken:  (str) auth token, obtained via login [required]
+    : param deviceids:  (list) unique ids of the devices [required]
+    : param appid:  (str) unique app id [required]
+    : param schedule: (str) Time in ticks,Unix Time in Microseconds UTC [optional]
+    : param maxBatchSize: (int) maximum number of devices per batch [optional]
+    """
+    return [(chunk, uninstallApp(iem_url, bearertoken, chunk, appid, schedule))
+            for chunk in _chunks(deviceids, maxBatchSize)]
+
+
+@instrumented
 def getAppId(iem_url, bearertoken, appTitle):
     url = f"{iem_url}/p.service/api/v4/applications/names/{appTitle}"
     payload = {}
     headers = {
         'Authorization': bearertoken
     }
-    response = requests.request(
-        "GET", url, headers=headers, verify=False, data=payload)
-    if str(response.status_code) == "200":
-        return RelevantResponse(True, str(response.status_code), "appId", response.json()['data']['applicationId'])
-    else:
-        return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    try:
+        response = getClient(iem_url).request(
+            "GET", url, headers=headers, data=payload)
+        if str(response.status_code) == "200":
+            return RelevantResponse(True, str(response.status_code), "appId", response.json()['data']['applicationId'])
+        else:
+            return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    except Exception as e:
+        print(f'Unexpected error during app id lookup: {str(e)}')
+        return RelevantResponse(False, -1, 'error', e)
 
 
+@instrumented
 def deleteApp(iem_url, bearertoken, app_id):
     """ Short: Delete apps.
     Description: This method Delete the specified app from IEM.
@@ -259,16 +805,17 @@ def deleteApp(iem_url, bearertoken, app_id):
     }
 
     try:
-        response = requests.delete(url, headers=headers, verify=False)
+        response = getClient(iem_url).delete(url, headers=headers)
         if response.status_code == 200:
             return RelevantResponse(True, str(response.status_code), "Deleted App", response.json()['data'])
         else:
-            return RelevantResponse(False, str(response.status_code), "Deleted App Error", response.json()['errors'][0]['message'])
+            return RelevantResponse(False, str(response.status_code), "Deleted App Error", _errorMessage(response))
     except Exception as e:
         print(f'Unexpected error during app deletion: {str(e)}')
         return RelevantResponse(False, -1, 'error', e)
 
 
+@instrumented
 def addVersionedConfiguration(iem_url, bearertoken, appId, configuration):
     url = f"{iem_url}/p.service/api/v4/applications/{appId}/configs"
     headers = {
@@ -283,54 +830,87 @@ def addVersionedConfiguration(iem_url, bearertoken, appId, configuration):
         "secured": "false",
         "versioned": "true"
     }
-    response = requests.request(
-        "POST", url, headers=headers, verify=False, json=payload)
-    if str(response.status_code) == "200":
-        return RelevantResponse(True, str(response.status_code), "configId", response.json()['data']['appConfigId'])
-    else:
-        return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    try:
+        response = getClient(iem_url).request(
+            "POST", url, headers=headers, json=payload)
+        if str(response.status_code) == "200":
+            invalidateConfigs(iem_url, appId)
+            return RelevantResponse(True, str(response.status_code), "configId", response.json()['data']['appConfigId'])
+        else:
+            return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    except Exception as e:
+        print(f'Unexpected error during configuration creation: {str(e)}')
+        return RelevantResponse(False, -1, 'error', e)
 
 
+@instrumented
 def getAllConfigurationsOfApp(iem_url, bearertoken, appId):
     url = f"{iem_url}/p.service/api/v4/applications/{appId}/configs"
     headers = {
         'Authorization': bearertoken,
         'Content-Type': 'application/json'
     }
-    response = requests.request("GET", url, headers=headers, verify=False)
-    if str(response.status_code) == "200":
-        return RelevantResponse(True, str(response.status_code), "fullConfigDetails", response.json()['data'])
-    else:
-        return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    try:
+        response = getClient(iem_url).request("GET", url, headers=headers)
+        if str(response.status_code) == "200":
+            return RelevantResponse(True, str(response.status_code), "fullConfigDetails", response.json()['data'])
+        else:
+            return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    except Exception as e:
+        print(f'Unexpected error during list configurations: {str(e)}')
+        return RelevantResponse(False, -1, 'error', e)
+
+
+def _configScope(iem_url, appId):
+    return f"{_hostKey(iem_url)}|{appId}"
+
+
+def _loadConfigIndexes(iem_url, bearertoken, appId):
+    response = getAllConfigurationsOfApp(iem_url, bearertoken, appId)
+    if not response.success:
+        raise IEMApiError(response)
+    configs = {}
+    versions = {}
+    for x in response.content:
+        configs[x['displayName']] = x['appConfigId']
+        for y in x.get('appConfigVersionLst') or []:
+            versions[f"{x['displayName']}/{y['refName']}"] = y['appConfigVersionId']
+    resolverCache.put("configVersions", _configScope(
+        iem_url, appId), versions)
+    return configs, versions
 
 
 def getConfigId(iem_url, bearertoken, appId, configDisplayName):
-    configurationData = getAllConfigurationsOfApp(
-        iem_url, bearertoken, appId).content
-    for x in configurationData:
-        if x['displayName'] == configDisplayName:
-            appConfigId = x['appConfigId']
-            return appConfigId
+    try:
+        return resolverCache.resolve("configs", _configScope(iem_url, appId), configDisplayName,
+                                     lambda: _loadConfigIndexes(iem_url, bearertoken, appId)[0])
+    except IEMApiError as e:
+        print(f'Unexpected error during config lookup: {e.response.content}')
+        return None
 
 
 def getConfigVersionId(iem_url, bearertoken, appId, configDisplayName, configVersionName):
-    configurationData = getAllConfigurationsOfApp(
-        iem_url, bearertoken, appId).content
+    try:
+        return resolverCache.resolve("configVersions", _configScope(iem_url, appId), f"{configDisplayName}/{configVersionName}",
+                                     lambda: _loadConfigIndexes(iem_url, bearertoken, appId)[1])
+    except IEMApiError as e:
+        print(f'Unexpected error during config lookup: {e.response.content}')
+        return None
+
 
-    for x in configurationData:
-        if x['displayName'] == configDisplayName:
-            for y in x['appConfigVersionLst']:
-                if y['refName'] == configVersionName:
-                    appConfigVersionId = y['appConfigVersionId']
-                    return appConfigVersionId
+def invalidateConfigs(iem_url, appId):
+    resolverCache.invalidate("configs", _configScope(iem_url, appId))
+    resolverCache.invalidate("configVersions", _configScope(iem_url, appId))
 
 
+@instrumented
 def uploadJsonAsConfigurationFile(iem_url, bearertoken, appId, appConfigId, appConfig):
     url = f"{iem_url}/p.service/api/v4/applications/{appId}/configs/{appConfigId}/versions"
     configversion = {
         "refName": appConfig['referenceName'],
         "description": appConfig['description']
     }
+    from requests_toolbelt import MultipartEncoder
     m = MultipartEncoder(fields={'configversion': str(configversion), 'filename': str(
         appConfig['filename']), 'file': (str(appConfig['filename']), str(appConfig['content']), 'application/json')})
 
@@ -339,15 +919,124 @@ def uploadJsonAsConfigurationFile(iem_url, bearertoken, appId, appConfigId, appC
         'Content-Type': m.content_type
     }
 
-    response = requests.request(
-        "POST", url, headers=headers, verify=False, data=m)
+    try:
+        response = getClient(iem_url).request(
+            "POST", url, headers=headers, data=m)
+    except Exception as e:
+        print(f'Unexpected error during config upload: {str(e)}')
+        return RelevantResponse(False, -1, 'error', e)
 
     if str(response.status_code) == "200":
+        invalidateConfigs(iem_url, appId)
         return RelevantResponse(True, str(response.status_code), "Status", "Upload was successful.")
     else:
         return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
 
 
+hashMarker = "sha256:"
+
+
+def fileSha256(source, chunkSize=1024 * 1024):
+    """Returns the sha256 hex digest of a file path or file-like object, read in chunks. File objects are rewound."""
+    digest = hashlib.sha256()
+    if hasattr(source, "read"):
+        start = source.tell() if source.seekable() else None
+        # text-mode files return "" at the end, so stop on any empty chunk
+        while chunk := source.read(chunkSize):
+            digest.update(chunk.encode() if isinstance(chunk, str) else chunk)
+        if start is not None:
+            source.seek(start)
+        return digest.hexdigest()
+    with open(source, "rb") as f:
+        for chunk in iter(lambda: f.read(chunkSize), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def getLatestConfigVersion(iem_url, bearertoken, appId, appConfigId):
+    """Returns the newest version entry of a configuration, or None if it has no versions."""
+    response = getAllConfigurationsOfApp(iem_url, bearertoken, appId)
+    if not response.success:
+        raise IEMApiError(response)
+    for x in response.content:
+        if x['appConfigId'] == appConfigId:
+            versions = x.get('appConfigVersionLst') or []
+            return versions[0] if versions else None
+    return None
+
+
+@instrumented
+def uploadConfigurationFile(iem_url, bearertoken, appId, appConfigId, referenceName, description, source, filename=None,
+                            contentType='application/json', progress=None, skipIfUnchanged=True, latestVersion=None):
+    """ Short: Upload a configuration file as a new version, streamed from disk.
+    Description: This method uploads a file path or binary file object as a new version of a configuration without
+    loading it into memory. The content hash is stored in the version description; if the newest version on the
+    server already carries the same hash, nothing is uploaded.
+    : param iem_url:  (str) address of IEM [required]
+    : param bearertoken:  (str) auth token, obtained via login [required]
+    : param appId:  (str) unique app id [required]
+    : param appConfigId:  (str) unique id of the configuration [required]
+    : param referenceName:  (str) reference name of the new version [required]
+    : param description:  (str) description of the new version [required]
+    : param source:  (str|file) path or binary file object of the content [required]
+    : param filename:  (str) file name on the server. Default: base name of the path [optional]
+    : param contentType:  (str) content type of the file [optional]
+    : param progress:  (callable) called as progress(bytesSent, totalBytes) while uploading [optional]
+    : param skipIfUnchanged:  (bool) skip the upload if the newest version has the same content hash [optional]
+    : param latestVersion:  (dict) newest version entry if already known, to save the lookup [optional]
+    """
+    digest = fileSha256(source)
+    marker = f"{hashMarker}{digest}"
+    if skipIfUnchanged:
+        if latestVersion is None:
+            try:
+                latestVersion = getLatestConfigVersion(
+                    iem_url, bearertoken, appId, appConfigId)
+            except IEMApiError as e:
+                return e.response
+        if latestVersion and marker in (latestVersion.get('description') or ""):
+            return RelevantResponse(True, "304", "Status", "Upload skipped, content unchanged.")
+
+    if filename is None:
+        filename = os.path.basename(getattr(source, "name", None) or str(source))
+    ownsFile = not hasattr(source, "read")
+    fileobj = open(source, "rb") if ownsFile else source
+    try:
+        url = f"{iem_url}/p.service/api/v4/applications/{appId}/configs/{appConfigId}/versions"
+        configversion = {
+            "refName": referenceName,
+            "description": f"{description} [{marker}]"
+        }
+        from requests_toolbelt import MultipartEncoder, MultipartEncoderMonitor
+        m = MultipartEncoder(fields={'configversion': str(configversion), 'filename': str(
+            filename), 'file': (str(filename), fileobj, contentType)})
+        if progress:
+            m = MultipartEncoderMonitor(
+                m, lambda monitor: progress(monitor.bytes_read, monitor.len))
+
+        headers = {
+            'Authorization': bearertoken,
+            'Content-Type': m.content_type
+        }
+
+        try:
+            response = getClient(iem_url).request(
+                "POST", url, headers=headers, data=m)
+        except Exception as e:
+            print(f'Unexpected error during config upload: {str(e)}')
+            return RelevantResponse(False, -1, 'error', e)
+    finally:
+        if ownsFile:
+            fileobj.close()
+
+    if str(response.status_code) == "200":
+        invalidateConfigs(iem_url, appId)
+        return RelevantResponse(True, str(response.status_code), "Status", "Upload was successful.")
+    else:
+        return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+
+
+@instrumented
 def createDeviceInMyEdgeCores(iem_url, bearertoken, ied_configuration):
     url = f"{iem_url}/p.service/api/v4/devices/create"
 
@@ -355,44 +1044,122 @@ def createDeviceInMyEdgeCores(iem_url, bearertoken, ied_configuration):
         'Authorization': bearertoken,
         'Content-Type': 'application/json'
     }
-    response = requests.request(
-        "POST", url, headers=headers, verify=False, json=ied_configuration)
+    try:
+        response = getClient(iem_url).request(
+            "POST", url, headers=headers, json=ied_configuration)
+    except Exception as e:
+        print(f'Unexpected error during device creation: {str(e)}')
+        return RelevantResponse(False, -1, 'error', e)
     if str(response.status_code) == "200":
         return RelevantResponse(True, str(response.status_code), "onboardingFile", response.text)
     else:
         return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
 
 
+@instrumented
+def createDeviceInMyEdgeCoresToFile(iem_url, bearertoken, ied_configuration, path, chunkSize=64 * 1024):
+    """
+    Short: Create a device and stream its onboarding file to disk
+    Description: Same as createDeviceInMyEdgeCores, but the onboarding file is written to path while it is received
+    instead of being returned as a string.
+    """
+    url = f"{iem_url}/p.service/api/v4/devices/create"
+
+    headers = {
+        'Authorization': bearertoken,
+        'Content-Type': 'application/json'
+    }
+    tmp = f"{path}.part"
+    try:
+        response = getClient(iem_url).request(
+            "POST", url, headers=headers, json=ied_configuration, stream=True)
+        with response:
+            if str(response.status_code) != "200":
+                return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+            with open(tmp, "wb") as f:
+                for chunk in response.iter_content(chunkSize):
+                    f.write(chunk)
+            os.replace(tmp, path)
+    except Exception as e:
+        print(f'Unexpected error during device creation: {str(e)}')
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        return RelevantResponse(False, -1, 'error', e)
+    return RelevantResponse(True, str(response.status_code), "onboardingFile", path)
+
+
+@instrumented
 def getDeviceIdbyName(iem_url, bearertoken, ied_name):
     url = f"{iem_url}/p.service/api/v4/devices/{ied_name}/discovery"
     headers = {
         'Authorization': bearertoken,
         'Content-Type': 'application/json'
     }
-    response = requests.request("GET", url, headers=headers, verify=False)
-    print(response)
-    if str(response.status_code) == "200":
-        return RelevantResponse(True, str(response.status_code), "devicebyname", response.json()["discoveryDetails"]["deviceId"])
-    else:
-        return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    try:
+        response = getClient(iem_url).request("GET", url, headers=headers)
+        if str(response.status_code) == "200":
+            return RelevantResponse(True, str(response.status_code), "devicebyname", response.json()["discoveryDetails"]["deviceId"])
+        else:
+            return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    except Exception as e:
+        print(f'Unexpected error during device lookup: {str(e)}')
+        return RelevantResponse(False, -1, 'error', e)
 
 
-def getCategoryId(iem_url, category_name):
+@instrumented(name="getCategoryId")
+def _loadCategoryIndex(iem_url):
     url = f"{iem_url}/p.service/api/v4/categories"
     headers = {}
-    response = requests.request("GET", url, headers=headers, verify=False)
-    category_id = ""
-    for items in response.json()["data"]:
-        if category_name == items["name"]:
-            category_id = items["categoryId"]
-    if str(response.status_code) == "200":
-        return RelevantResponse(True, str(response.status_code), "categoryid", category_id)
-    else:
-        return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    try:
+        response = getClient(iem_url).request("GET", url, headers=headers)
+    except Exception as e:
+        raise IEMApiError(RelevantResponse(False, -1, 'error', e)) from e
+    if str(response.status_code) != "200":
+        raise IEMApiError(RelevantResponse(
+            False, str(response.status_code), "UnexpectedBehaviour", response.text))
+    return {items["name"]: items["categoryId"] for items in response.json()["data"]}
+
+
+def getCategoryId(iem_url, category_name):
+    try:
+        category_id = resolverCache.resolve("categories", _hostKey(iem_url), category_name,
+                                            lambda: _loadCategoryIndex(iem_url), "")
+    except IEMApiError as e:
+        return e.response
+    return RelevantResponse(True, "200", "categoryid", category_id)
+
+
+def resolveDeviceId(iemUrl, bearerToken, deviceName):
+    """
+    Short: Resolve a device name to its id
+    Description: Looks the name up in the cached device index, which is built from one full device listing.
+    Returns None if there is no such device. Raises IEMApiError if the listing fails.
+    : param iemUrl:        (str) the address of iem [required]
+    : param bearerToken:    (str) the authorication token [required]
+    : param deviceName:     (str) name of the device [required]
+    """
+    return resolverCache.resolve("devices", _hostKey(iemUrl), deviceName,
+                                 lambda: {d.deviceName: d.deviceId for d in iterIEDs(iemUrl, bearerToken, prefetch=True,
+                                                                                     model=Device, stream=True)})
+
+
+def resolveAppId(iemUrl, bearerToken, appTitle):
+    """
+    Short: Resolve an application title to its id
+    Description: Looks the title up in the cached catalog index, which is built from one full application listing.
+    Returns None if there is no such app. Raises IEMApiError if the listing fails.
+    : param iemUrl:        (str) the address of iem [required]
+    : param bearerToken:    (str) the authorication token [required]
+    : param appTitle:       (str) title of the application [required]
+    """
+    return resolverCache.resolve("apps", _hostKey(iemUrl), appTitle,
+                                 lambda: {a.title: a.applicationId for a in iterApps(iemUrl, bearerToken, prefetch=True,
+                                                                                    model=App, stream=True)})
 
 # Not finished yet
 
 
+@instrumented
 def getNewestAppVersionId(iem_url, bearertoken, appId):
     url = f"{iem_url}/p.service/api/v4/dev-apps/{appId}"
     headers = {
@@ -400,57 +1167,150 @@ def getNewestAppVersionId(iem_url, bearertoken, appId):
         'Content-Type': 'application/json'
     }
 
-    response = requests.request("GET", url, headers=headers, verify=False)
+    try:
+        response = getClient(iem_url).request("GET", url, headers=headers)
 
-    if str(response.status_code) == "200":
-        return RelevantResponse(True, str(response.status_code), "NewestAppVersionId", response.json()['data']['devappdetail']['versions'][0]['versionId'])
-    else:
-        return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+        if str(response.status_code) == "200":
+            return RelevantResponse(True, str(response.status_code), "NewestAppVersionId", response.json()['data']['devappdetail']['versions'][0]['versionId'])
+        else:
+            return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    except Exception as e:
+        print(f'Unexpected error during app version lookup: {str(e)}')
+        return RelevantResponse(False, -1, 'error', e)
 
 
-def deployAppToIED(iem_url, bearertoken, appId, appVersionId, deviceId):
+@instrumented
+def getAppVersions(iem_url, bearertoken, appId):
+    """Returns the versions of an app, newest first, each with its versionId and versionNumber."""
+    url = f"{iem_url}/p.service/api/v4/dev-apps/{appId}"
+    headers = {
+        'Authorization': bearertoken,
+        'Content-Type': 'application/json'
+    }
+
+    try:
+        response = getClient(iem_url).request("GET", url, headers=headers)
+
+        if str(response.status_code) == "200":
+            return RelevantResponse(True, str(response.status_code), "AppVersions", response.json()['data']['devappdetail']['versions'])
+        else:
+            return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+    except Exception as e:
+        print(f'Unexpected error during app version lookup: {str(e)}')
+        return RelevantResponse(False, -1, 'error', e)
+
+
+@instrumented(name="deployAppBatch")
+def _postDeployBatch(iem_url, bearertoken, appId, appVersionId, deviceIds):
     url = f"{iem_url}/p.service/api/v4/applications/{appId}/versions/{appVersionId}/batch?operation=installApplication&isRetainSecret=false&allow=true"
-    file = {"devices": [deviceId]}
+    file = {"devices": _deviceList(deviceIds)}
+    from requests_toolbelt import MultipartEncoder
     m = MultipartEncoder({"infoMap": str(file)})
     headers = {
         'Authorization': bearertoken,
         'Content-Type': m.content_type
     }
-    response = requests.request(
-        "POST", url, headers=headers, verify=False, data=m)
-    print(response.content)
+    return getClient(iem_url).request(
+        "POST", url, headers=headers, data=m)
+
+
+def deployAppToIEDs(iem_url, bearertoken, appId, appVersionId, deviceIds, maxBatchSize=defaultMaxBatchSize):
+    """ Short: Deploy an app version to many devices.
+    Description: This method installs an application version on a set of devices with one batch per maxBatchSize devices
+    instead of one batch per device. Returns a list of (device ids, RelevantResponse) tuples, one per submitted batch.
+    : param iem_url:  (str) address of IEM [required]
+    : param bearertoken:  (str) auth token, obtained via login [required]
+    : param appId:  (str) unique app id [required]
+    : param appVersionId:  (str) unique id of the app version [required]
+    : param deviceIds:  (list) unique ids of the devices [required]
+    : param maxBatchSize: (int) maximum number of devices per batch [optional]
+    """
+    results = []
+    for chunk in _chunks(deviceIds, maxBatchSize):
+        try:
+            response = _postDeployBatch(
+                iem_url, bearertoken, appId, appVersionId, chunk)
+        except Exception as e:
+            print(f'Unexpected error during deployment: {str(e)}')
+            results.append((chunk, RelevantResponse(False, -1, 'error', e)))
+            continue
+        if str(response.status_code) == "200":
+            results.append((chunk, RelevantResponse(
+                True, str(response.status_code), "Batch", _batchData(response))))
+        else:
+            results.append((chunk, RelevantResponse(
+                False, str(response.status_code), "UnexpectedBehaviour", response.text)))
+    return results
+
+
+def deployAppToIED(iem_url, bearertoken, appId, appVersionId, deviceId):
+    try:
+        response = _postDeployBatch(
+            iem_url, bearertoken, appId, appVersionId, deviceId)
+    except Exception as e:
+        print(f'Unexpected error during deployment: {str(e)}')
+        return RelevantResponse(False, -1, 'error', e)
     if str(response.status_code) == "200":
         return RelevantResponse(True, str(response.status_code), "Status", "Application Download was triggered.")
     else:
         return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
 
 
-def getActivationStatusOfDevice(iem_url, bearertoken, deviceName):
-    url = f"{iem_url}:9443/p.service/api/v4/devices"
+@instrumented
+def getActivationStatusOfDevices(iem_url, bearertoken, deviceNames, pageSize=defaultPageSize):
+    """
+    Short: Activation status of many devices
+    Description: Walks the pages of the device list once and returns a dict deviceName -> isActivationConfirmed for
+    every requested name (False for names that are not in the list yet). The device service listens on
+    activationPort unless iem_url already names a port.
+    """
+    url = f"{_withPort(iem_url, activationPort)}{devUrl}/devices"
     headers = {
         'Authorization': bearertoken,
         'Content-Type': 'application/json'
     }
-    response = requests.request("GET", url, headers=headers, verify=False)
+    wanted = set(deviceNames)
+    activation = {name: False for name in wanted}
+    page = 1
+    while True:
+        try:
+            response = getClient(iem_url).request("GET", url, headers=headers,
+                                                  params={"size": pageSize, "page": page})
+        except Exception as e:
+            return RelevantResponse(False, -1, 'error', e)
+        if str(response.status_code) != "200":
+            return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+        body = response.json()
+        items = body.get('data') or []
+        for x in items:
+            if x.get('deviceName') in wanted:
+                activation[x['deviceName']] = bool(x.get('isActivationConfirmed'))
+        info = body.get('page') or {}
+        # without page metadata the service returned the whole list
+        if not info or _lastPage(items, info, page):
+            return RelevantResponse(True, str(response.status_code), "isActivated", activation)
+        page += 1
 
-    if str(response.status_code) == "200":
-        isActivated = False
-        for x in response.json()['data']:
-            if x['deviceName'] == deviceName:
-                isActivated = x['isActivationConfirmed']
-            break
-        return RelevantResponse(True, str(response.status_code), "isActivated", isActivated)
-    else:
-        return RelevantResponse(False, str(response.status_code), "UnexpectedBehaviour", response.text)
+
+def getActivationStatusOfDevice(iem_url, bearertoken, deviceName):
+    response = getActivationStatusOfDevices(iem_url, bearertoken, [deviceName])
+    if response.success:
+        response.content = response.content[deviceName]
+    return response
 
 
+@instrumented
 def logout(iem_url, bearertoken):
     url = f"{iem_url}/p.service/api/v4/logout"
     headers = {
         'Authorization': bearertoken,
         'Content-Type': 'application/json'
     }
-    response = requests.request("GET", url, headers=headers, verify=False)
+    try:
+        response = getClient(iem_url).request("GET", url, headers=headers)
+    except Exception as e:
+        print(f'Unexpected error during logout: {str(e)}')
+        return RelevantResponse(False, -1, 'error', e)
 
     if str(response.status_code) == "200":
         return RelevantResponse(True, str(response.status_code), "Status", "Logout was successful.")
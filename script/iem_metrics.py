@@ -0,0 +1,241 @@
+import functools
+import json
+import threading
+import time
+from collections import Counter
+
+latencyBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+_local = threading.local()
+_adapterClass = None
+
+
+def _timedConnect(connect):
+    @functools.wraps(connect)
+    def timed(self):
+        start = time.perf_counter()
+        try:
+            connect(self)
+        finally:
+            _local.connectSeconds = getattr(
+                _local, "connectSeconds", 0.0) + time.perf_counter() - start
+    return timed
+
+
+def _buildAdapterClass():
+    # requests and urllib3 are only imported once the first IEM client is created, to keep imports fast
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _TimedHTTPConnection(HTTPConnection):
+        connect = _timedConnect(HTTPConnection.connect)
+
+    class _TimedHTTPSConnection(HTTPSConnection):
+        connect = _timedConnect(HTTPSConnection.connect)
+
+    class _TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = _TimedHTTPConnection
+
+    class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = _TimedHTTPSConnection
+
+    class InstrumentedHTTPAdapter(HTTPAdapter):
+        """HTTPAdapter whose connections record the time spent in connect (DNS, TCP and TLS) of new connections."""
+
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+    return InstrumentedHTTPAdapter
+
+
+def __getattr__(name):
+    global _adapterClass
+    if name == "InstrumentedHTTPAdapter":
+        if _adapterClass is None:
+            _adapterClass = _buildAdapterClass()
+        return _adapterClass
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.totalSeconds = 0.0
+        self.maxSeconds = 0.0
+        self.connectSeconds = 0.0
+        self.connects = 0
+        self.ttfbSeconds = 0.0
+        self.bytesOut = 0
+        self.bytesIn = 0
+        self.statuses = Counter()
+        self.buckets = [0] * len(latencyBuckets)
+
+    def add(self, status, connectSeconds, ttfbSeconds, totalSeconds, bytesOut, bytesIn, retries):
+        self.count += 1
+        self.retries += retries
+        self.totalSeconds += totalSeconds
+        self.maxSeconds = max(self.maxSeconds, totalSeconds)
+        self.ttfbSeconds += ttfbSeconds
+        if connectSeconds:
+            self.connects += 1
+            self.connectSeconds += connectSeconds
+        self.bytesOut += bytesOut
+        self.bytesIn += bytesIn
+        self.statuses[str(status)] += 1
+        if status == "error" or (isinstance(status, int) and status >= 400):
+            self.errors += 1
+        for i, bound in enumerate(latencyBuckets):
+            if totalSeconds <= bound:
+                self.buckets[i] += 1
+
+    def asDict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "totalSeconds": round(self.totalSeconds, 6),
+            "meanSeconds": round(self.totalSeconds / self.count, 6) if self.count else 0.0,
+            "maxSeconds": round(self.maxSeconds, 6),
+            "newConnections": self.connects,
+            "connectSeconds": round(self.connectSeconds, 6),
+            "ttfbSeconds": round(self.ttfbSeconds, 6),
+            "bytesOut": self.bytesOut,
+            "bytesIn": self.bytesIn,
+            "statuses": dict(self.statuses),
+        }
+
+
+class Instrumentation:
+    """
+    Short: Per-endpoint timing of IEM requests
+    Description: Aggregates, per iem_functions_api function and HTTP method, the request count, connect time of new
+    connections, time to first byte, total time, bytes sent and received, retries and a status-code histogram.
+    Individual requests are kept as trace events up to maxEvents. When disabled, recording costs one attribute check.
+    : param enabled:   (bool) record requests [optional]
+    : param maxEvents: (int) maximum number of trace events kept [optional]
+    """
+
+    def __init__(self, enabled=False, maxEvents=10000):
+        self.enabled = enabled
+        self.maxEvents = maxEvents
+        self.startedAt = time.time()
+        self.events = []
+        self.droppedEvents = 0
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, method, status, connectSeconds, ttfbSeconds, totalSeconds, bytesOut, bytesIn, retries):
+        with self._lock:
+            stats = self._stats.get((endpoint, method))
+            if stats is None:
+                stats = self._stats[(endpoint, method)] = EndpointStats()
+            stats.add(status, connectSeconds, ttfbSeconds, totalSeconds, bytesOut, bytesIn, retries)
+            if len(self.events) < self.maxEvents:
+                self.events.append({"endpoint": endpoint, "method": method, "status": status,
+                                    "start": round(time.time() - totalSeconds - self.startedAt, 6),
+                                    "connect": round(connectSeconds, 6), "ttfb": round(ttfbSeconds, 6),
+                                    "total": round(totalSeconds, 6), "bytesOut": bytesOut, "bytesIn": bytesIn,
+                                    "retries": retries})
+            else:
+                self.droppedEvents += 1
+
+    def summary(self):
+        with self._lock:
+            return {f"{method} {endpoint}": stats.asDict() for (endpoint, method), stats in sorted(self._stats.items())}
+
+    def exportJson(self, path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as f:
+            json.dump({"startedAt": self.startedAt, "endpoints": self.summary(), "events": events,
+                       "droppedEvents": self.droppedEvents}, f, indent=2)
+
+    def exportPrometheus(self, path):
+        lines = []
+
+        def metric(name, kind, help, samples):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        with self._lock:
+            items = sorted(self._stats.items())
+            labels = {key: f'endpoint="{key[0]}",method="{key[1]}"' for key, _ in items}
+            metric("iem_requests_total", "counter", "IEM requests by final status.",
+                   [f'iem_requests_total{{{labels[key]},status="{status}"}} {count}'
+                    for key, stats in items for status, count in sorted(stats.statuses.items())])
+            durations = []
+            for key, stats in items:
+                for bound, count in zip(latencyBuckets, stats.buckets):
+                    durations.append(f'iem_request_duration_seconds_bucket{{{labels[key]},le="{bound}"}} {count}')
+                durations.append(f'iem_request_duration_seconds_bucket{{{labels[key]},le="+Inf"}} {stats.count}')
+                durations.append(f'iem_request_duration_seconds_sum{{{labels[key]}}} {stats.totalSeconds}')
+                durations.append(f'iem_request_duration_seconds_count{{{labels[key]}}} {stats.count}')
+            metric("iem_request_duration_seconds", "histogram", "Total time of IEM requests.", durations)
+            metric("iem_connect_seconds_total", "counter", "Time spent opening new connections (DNS, TCP, TLS).",
+                   [f"iem_connect_seconds_total{{{labels[key]}}} {stats.connectSeconds}" for key, stats in items])
+            metric("iem_ttfb_seconds_total", "counter", "Time to first byte of IEM responses.",
+                   [f"iem_ttfb_seconds_total{{{labels[key]}}} {stats.ttfbSeconds}" for key, stats in items])
+            metric("iem_bytes_sent_total", "counter", "Request body bytes sent.",
+                   [f"iem_bytes_sent_total{{{labels[key]}}} {stats.bytesOut}" for key, stats in items])
+            metric("iem_bytes_received_total", "counter", "Response body bytes received.",
+                   [f"iem_bytes_received_total{{{labels[key]}}} {stats.bytesIn}" for key, stats in items])
+            metric("iem_retries_total", "counter", "Retried IEM requests.",
+                   [f"iem_retries_total{{{labels[key]}}} {stats.retries}" for key, stats in items])
+        with open(path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+    def export(self, path):
+        """Writes Prometheus text format if path ends in .prom or .txt, otherwise a JSON trace."""
+        if path.endswith((".prom", ".txt")):
+            self.exportPrometheus(path)
+        else:
+            self.exportJson(path)
+
+
+metrics = Instrumentation()
+
+
+def setInstrumentation(instrumentation):
+    global metrics
+    metrics = instrumentation
+    return instrumentation
+
+
+def getInstrumentation():
+    return metrics
+
+
+def instrumented(func=None, name=None):
+    """Labels the requests made inside func with its name (or name) in the instrumentation."""
+    if func is None:
+        return lambda f: instrumented(f, name)
+    label = name or func.__name__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not metrics.enabled:
+            return func(*args, **kwargs)
+        previous = getattr(_local, "endpoint", None)
+        _local.endpoint = label
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _local.endpoint = previous
+    return wrapper
+
+
+def currentEndpoint(default):
+    return getattr(_local, "endpoint", None) or default
+
+
+def startRequest():
+    _local.connectSeconds = 0.0
+
+
+def connectSeconds():
+    return getattr(_local, "connectSeconds", 0.0)
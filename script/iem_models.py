@@ -0,0 +1,71 @@
+class Record:
+    """
+    Short: Compact record of an IEM object
+    Description: Keeps only the fields listed in _fields (JSON key -> attribute) in __slots__ instead of the whole
+    decoded JSON object. Records can still be read like the dicts they replace (record["deviceName"], .get()).
+    """
+    __slots__ = ()
+    _fields = {}
+
+    def __init__(self, **values):
+        for attr in self.__slots__:
+            setattr(self, attr, values.get(attr))
+
+    @classmethod
+    def fromJson(cls, data):
+        record = cls.__new__(cls)
+        for key, attr in cls._fields.items():
+            setattr(record, attr, data.get(key))
+        return record
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, self._fields.get(key, key))
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        try:
+            value = self[key]
+        except KeyError:
+            return default
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return key in self._fields or key in self.__slots__
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.asDict() == other.asDict()
+
+    def asDict(self):
+        return {key: getattr(self, attr) for key, attr in self._fields.items()}
+
+    def __repr__(self):
+        values = ", ".join(f"{attr}={getattr(self, attr)!r}" for attr in self.__slots__)
+        return f"{type(self).__name__}({values})"
+
+
+class Device(Record):
+    __slots__ = ("deviceId", "deviceName", "isActivationConfirmed")
+    _fields = {"deviceId": "deviceId", "deviceName": "deviceName",
+               "isActivationConfirmed": "isActivationConfirmed"}
+
+
+class App(Record):
+    __slots__ = ("applicationId", "title")
+    _fields = {"applicationId": "applicationId", "title": "title"}
+
+
+class InstalledApp(Record):
+    __slots__ = ("applicationId", "title", "versionNumber")
+    _fields = {"applicationId": "applicationId",
+               "title": "title", "versionNumber": "versionNumber"}
+
+    @classmethod
+    def fromJson(cls, data):
+        record = super().fromJson(data)
+        if record.versionNumber is None:
+            # installed-apps entries of some IEM versions name the field version or versionName
+            record.versionNumber = data.get("version") or data.get("versionName")
+        return record
+
@@ -0,0 +1,248 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+idempotentMethods = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request while the circuit breaker of its IEM host is open."""
+
+    def __init__(self, host, retryIn):
+        super().__init__(
+            f"Circuit breaker for {host} is open, retry in {retryIn:.1f}s")
+        self.host = host
+        self.retryIn = retryIn
+
+
+class TokenBucket:
+    """
+    Short: Client-side rate limiter
+    Description: Allows rate requests per second on average and bursts of up to burst requests.
+    : param rate:  (float) tokens added per second [required]
+    : param burst: (float) bucket capacity [optional]
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, rate))
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available and returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens +
+                                   (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+class CircuitBreaker:
+    """
+    Short: Per-host circuit breaker
+    Description: Opens after failureThreshold consecutive failures and rejects calls for resetTimeout seconds. Then
+    one trial call is let through (half-open); its success closes the breaker, its failure opens it again.
+    : param failureThreshold: (int) consecutive failures that open the breaker [optional]
+    : param resetTimeout:     (float) seconds the breaker stays open [optional]
+    """
+
+    def __init__(self, failureThreshold=5, resetTimeout=30.0):
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.state = "closed"
+        self._failures = 0
+        self._openedAt = 0.0
+        self._lock = threading.Lock()
+
+    def retryIn(self):
+        """Returns 0 if a call may be made now, otherwise the seconds until the breaker lets a trial call through."""
+        with self._lock:
+            if self.state == "closed":
+                return 0.0
+            remaining = self._openedAt + self.resetTimeout - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self.state = "half-open"
+                return 0.0
+            return max(remaining, 0.0) if self.state == "open" else self.resetTimeout
+
+    def recordSuccess(self):
+        with self._lock:
+            self._failures = 0
+            self.state = "closed"
+
+    def recordFailure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half-open" or self._failures >= self.failureThreshold:
+                self.state = "open"
+                self._openedAt = time.monotonic()
+
+    def abandonTrial(self):
+        """Reopens a half-open breaker whose trial call ended without an outcome, so a later call is let through."""
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "open"
+                self._openedAt = time.monotonic()
+
+
+class PolicyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.retries = 0
+            self.throttled = 0
+            self.backoffSeconds = 0.0
+            self.rateLimitSeconds = 0.0
+            self.circuitRejections = 0
+
+    def add(self, **counters):
+        with self._lock:
+            for name, value in counters.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def asDict(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "throttled": self.throttled,
+                "backoffSeconds": round(self.backoffSeconds, 3),
+                "rateLimitSeconds": round(self.rateLimitSeconds, 3),
+                "circuitRejections": self.circuitRejections,
+            }
+
+    def __str__(self):
+        stats = self.asDict()
+        return "Requests: {requests}\tRetries: {retries}\tThrottled: {throttled}\tBackoff: {backoffSeconds}s\tRate limit wait: {rateLimitSeconds}s\tCircuit rejections: {circuitRejections}".format(**stats)
+
+
+class CallPolicy:
+    """
+    Short: Retry, rate-limit and circuit-breaker policy for IEM requests
+    Description: Wraps the sending of one request. Idempotent methods are retried on connection errors and on
+    retryStatuses. Other methods (POST) are only retried when the IEM certainly did not process the request: the
+    connection could not be established, or it answered 429/503. Backoff is exponential with full jitter and honours
+    Retry-After. rate (requests per second) and the circuit breaker apply per IEM host.
+    : param maxRetries:       (int) retries after the first attempt [optional]
+    : param backoffBase:      (float) backoff of the first retry in seconds [optional]
+    : param backoffMax:       (float) upper limit of one backoff in seconds [optional]
+    : param retryStatuses:    (tuple) status codes retried for idempotent methods [optional]
+    : param rate:             (float) client-side requests per second per host, None for unlimited [optional]
+    : param burst:            (float) burst size of the rate limiter [optional]
+    : param failureThreshold: (int) consecutive failures that open a host's circuit breaker, 0 to disable [optional]
+    : param resetTimeout:     (float) seconds a circuit breaker stays open [optional]
+    """
+
+    def __init__(self, maxRetries=3, backoffBase=0.5, backoffMax=30.0, retryStatuses=(429, 502, 503, 504),
+                 rate=None, burst=None, failureThreshold=5, resetTimeout=30.0):
+        self.maxRetries = maxRetries
+        self.backoffBase = backoffBase
+        self.backoffMax = backoffMax
+        self.retryStatuses = set(retryStatuses)
+        self.rate = rate
+        self.burst = burst
+        self.failureThreshold = failureThreshold
+        self.resetTimeout = resetTimeout
+        self.stats = PolicyStats()
+        self._limiters = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, host):
+        if not self.rate:
+            return None
+        with self._lock:
+            return self._limiters.setdefault(host, TokenBucket(self.rate, self.burst))
+
+    def breaker(self, host):
+        if not self.failureThreshold:
+            return None
+        with self._lock:
+            return self._breakers.setdefault(host, CircuitBreaker(self.failureThreshold, self.resetTimeout))
+
+    def _retryable(self, method, response=None, error=None, connectError=False):
+        if response is not None:
+            if method in idempotentMethods:
+                return response.status_code in self.retryStatuses
+            return response.status_code in (429, 503)
+        return method in idempotentMethods or connectError
+
+    def _backoff(self, attempt, response=None):
+        retryAfter = response.headers.get("Retry-After") if response is not None else None
+        if retryAfter:
+            try:
+                return min(self.backoffMax, max(0.0, float(retryAfter)))
+            except ValueError:
+                try:
+                    return min(self.backoffMax, max(0.0, parsedate_to_datetime(retryAfter).timestamp() - time.time()))
+                except (TypeError, ValueError):
+                    pass
+        return random.uniform(0, min(self.backoffMax, self.backoffBase * 2 ** attempt))
+
+    def execute(self, host, method, send, rewind=None, connectErrors=(), errors=(Exception,)):
+        """
+        Short: Send a request under the policy
+        Description: Calls send() until it returns a response that is not retried or the retries are used up.
+        rewind() is called before every retry and must return False if the request body cannot be sent again.
+        connectErrors are the exceptions raised before anything was sent, or a predicate telling them apart; errors are
+        all exceptions worth retrying.
+        """
+        method = method.upper()
+        limiter = self.limiter(host)
+        breaker = self.breaker(host)
+        attempt = 0
+        while True:
+            if breaker is not None:
+                retryIn = breaker.retryIn()
+                if retryIn > 0:
+                    self.stats.add(circuitRejections=1)
+                    raise CircuitOpenError(host, retryIn)
+            if limiter is not None:
+                self.stats.add(rateLimitSeconds=limiter.acquire())
+            self.stats.add(requests=1)
+            response = None
+            try:
+                response = send()
+            except errors as e:
+                if breaker is not None:
+                    breaker.recordFailure()
+                connectError = connectErrors(e) if callable(connectErrors) else isinstance(e, connectErrors)
+                retry = self._retryable(method, error=e, connectError=connectError)
+                if not retry or attempt >= self.maxRetries or (rewind and not rewind()):
+                    raise
+            except BaseException:
+                # any other error (or an interrupt) must not leave the breaker waiting for its trial call forever
+                if breaker is not None:
+                    breaker.abandonTrial()
+                raise
+            else:
+                if response.status_code == 429:
+                    self.stats.add(throttled=1)
+                if breaker is not None:
+                    if response.status_code >= 500:
+                        breaker.recordFailure()
+                    else:
+                        breaker.recordSuccess()
+                retry = self._retryable(method, response=response)
+                if not retry or attempt >= self.maxRetries or (rewind and not rewind()):
+                    return response
+                response.close()
+            delay = self._backoff(attempt, response)
+            self.stats.add(retries=1, backoffSeconds=delay)
+            time.sleep(delay)
+            attempt += 1
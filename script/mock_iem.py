@@ -0,0 +1,329 @@
+"""Local stand-in for the IEM API used by iem_functions_api, for benchmarks and offline development.
+
+    python3 mock_iem.py --devices 1000 --latency 0.05 --error_rate 0.01 --rate_limit 200
+"""
+import argparse
+import ast
+import base64
+import json
+import random
+import re
+import ssl
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+baseUrl = "/portal/api/v1"
+devUrl = "/p.service/api/v4"
+
+
+class MockIEMState:
+    """
+    Short: In-memory IEM
+    : param devices:      (int) number of simulated devices, named device0..deviceN-1 [optional]
+    : param apps:         (int) number of simulated catalog apps, named app0..appN-1 [optional]
+    : param latency:      (float) added response time in seconds [optional]
+    : param jitter:       (float) random extra response time of up to jitter seconds [optional]
+    : param errorRate:    (float) share of requests answered with 503 [optional]
+    : param rateLimit:    (float) requests per second above which the server answers 429, 0 for unlimited [optional]
+    : param maxPageSize:  (int) largest page size the listings return [optional]
+    : param batchSeconds: (float) seconds until a batch reports COMPLETED [optional]
+    : param batchFailRate:(float) share of device jobs that end FAILED [optional]
+    """
+
+    def __init__(self, devices=100, apps=5, latency=0.0, jitter=0.0, errorRate=0.0, rateLimit=0, maxPageSize=100,
+                 batchSeconds=1.0, batchFailRate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.errorRate = errorRate
+        self.rateLimit = rateLimit
+        self.maxPageSize = maxPageSize
+        self.batchSeconds = batchSeconds
+        self.batchFailRate = batchFailRate
+        self.devices = [{"deviceId": f"dev-{i:06d}", "deviceName": f"device{i}", "isActivationConfirmed": True}
+                        for i in range(devices)]
+        self.apps = [{"applicationId": f"app-{i:04d}", "title": f"app{i}",
+                      "versions": [{"versionId": f"app-{i:04d}-v1", "versionNumber": "0.0.1"}]}
+                     for i in range(apps)]
+        self.installed = {}
+        self.configs = {}
+        self.batches = {}
+        self.requests = 0
+        self.tokens = set()
+        self.lock = threading.Lock()
+        self._window = []
+
+    def throttled(self):
+        if not self.rateLimit:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rateLimit:
+                return True
+            self._window.append(now)
+            return False
+
+    def issueToken(self):
+        token = _token()
+        with self.lock:
+            self.tokens.add(token)
+        return token
+
+    def expireTokens(self):
+        """Invalidates every issued token, as if they had expired, so that the next requests get 401."""
+        with self.lock:
+            self.tokens.clear()
+
+    def createBatch(self, operation, appId, versionId, devices):
+        batchId = str(uuid.uuid4())
+        jobs = [{"deviceId": d, "fail": random.random() < self.batchFailRate} for d in devices]
+        with self.lock:
+            self.batches[batchId] = {"createdAt": time.monotonic(), "operation": operation, "appId": appId,
+                                     "versionId": versionId, "jobs": jobs}
+        return batchId
+
+    def batchStatus(self, batchId):
+        with self.lock:
+            batch = self.batches.get(batchId)
+            if batch is None:
+                return None
+            done = time.monotonic() - batch["createdAt"] >= self.batchSeconds
+            jobs = []
+            for job in batch["jobs"]:
+                state = "IN_PROGRESS"
+                if done:
+                    state = "FAILED" if job["fail"] else "COMPLETED"
+                    if state == "COMPLETED" and batch["operation"] == "installApplication":
+                        self._install(job["deviceId"], batch["appId"], batch["versionId"])
+                    elif state == "COMPLETED":
+                        self.installed.get(job["deviceId"], {}).pop(batch["appId"], None)
+                jobs.append({"deviceId": job["deviceId"], "status": state})
+        states = {job["status"] for job in jobs}
+        status = "IN_PROGRESS" if "IN_PROGRESS" in states else (
+            "FAILED" if "FAILED" in states else "COMPLETED")
+        return {"batchId": batchId, "status": status, "jobs": jobs}
+
+    def _install(self, deviceId, appId, versionId):
+        app = next((a for a in self.apps if a["applicationId"] == appId), None)
+        if app is None:
+            return
+        version = next((v for v in app["versions"] if v["versionId"] == versionId), app["versions"][0])
+        self.installed.setdefault(deviceId, {})[appId] = {
+            "applicationId": appId, "title": app["title"], "versionNumber": version["versionNumber"]}
+
+
+def _token():
+    claims = base64.urlsafe_b64encode(json.dumps(
+        {"exp": time.time() + 3600, "jti": str(uuid.uuid4())}).encode()).decode().rstrip("=")
+    return f"mock.{claims}.signature"
+
+
+def _formFields(contentType, body):
+    """Parses a multipart/form-data body into {field name: bytes}."""
+    if not contentType or not contentType.startswith("multipart/"):
+        return {}
+    message = BytesParser().parsebytes(f"Content-Type: {contentType}\r\n\r\n".encode() + body)
+    if not message.is_multipart():
+        return {}
+    return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.get_payload()}
+
+
+def _formLiteral(fields, name):
+    """Reads a form field the scripts send as str() of a Python dict."""
+    value = fields.get(name)
+    return ast.literal_eval(value.decode()) if value else {}
+
+
+class MockIEMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately; with Nagle the body waits for the client's delayed ACK (~40ms)
+    disable_nagle_algorithm = True
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body=None, headers=None):
+        payload = json.dumps(body if body is not None else {}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _error(self, status, message):
+        self._send(status, {"errors": [{"message": message}]})
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _page(self, items, query):
+        size = min(int(query.get("size", [10])[0] or 10), self.state.maxPageSize)
+        page = int(query.get("page", [1])[0] or 1)
+        totalPages = max(1, -(-len(items) // size))
+        start = (page - 1) * size
+        self._send(200, {"data": items[start:start + size],
+                         "page": {"size": size, "number": page, "totalElements": len(items), "totalPages": totalPages}})
+
+    def _handle(self, method):
+        state = self.state
+        with state.lock:
+            state.requests += 1
+        body = self._body()
+        fields = _formFields(self.headers.get("Content-Type"), body)
+        if state.latency or state.jitter:
+            time.sleep(state.latency + random.uniform(0, state.jitter))
+        if state.throttled():
+            return self._send(429, {"errors": [{"message": "Too many requests"}]}, {"Retry-After": "1"})
+        if state.errorRate and random.random() < state.errorRate:
+            return self._error(503, "Service unavailable")
+
+        url = urlsplit(self.path)
+        path = url.path
+        query = parse_qs(url.query)
+        if path.startswith(devUrl) or path.startswith(baseUrl):
+            route = path
+        else:
+            return self._error(404, f"Unknown path {path}")
+
+        if method == "POST" and route == f"{baseUrl}/login/direct":
+            return self._send(200, {"data": {"access_token": state.issueToken()}})
+        if route == f"{devUrl}/logout":
+            with state.lock:
+                state.tokens.discard(self.headers.get("Authorization"))
+            return self._send(200, {"data": {}})
+        if self.headers.get("Authorization") not in state.tokens and route != f"{devUrl}/categories":
+            return self._error(401, "Unauthorized")
+
+        if method == "GET" and route == f"{baseUrl}/devices":
+            return self._page(state.devices, query)
+        if method == "GET" and route == f"{devUrl}/devices":
+            return self._page(state.devices, query)
+        if method == "GET" and route == f"{baseUrl}/applications":
+            return self._page([{"applicationId": a["applicationId"], "title": a["title"]} for a in state.apps], query)
+        if method == "GET" and route == f"{baseUrl}/devices/installed-apps":
+            deviceId = query.get("deviceid", [None])[0]
+            with state.lock:
+                if deviceId:
+                    apps = list(state.installed.get(deviceId, {}).values())
+                else:
+                    apps = [app for device in state.installed.values() for app in device.values()]
+            return self._page(apps, query)
+        if method == "POST" and route == f"{baseUrl}/batches":
+            batchId = state.createBatch(query.get("operation", [""])[0], query.get("appid", [""])[0], None,
+                                        _formLiteral(fields, "infoMap").get("devices", []))
+            return self._send(200, {"data": batchId})
+        match = re.fullmatch(rf"{baseUrl}/batches/([^/]+)", route)
+        if method == "GET" and match:
+            status = state.batchStatus(match.group(1))
+            return self._send(200, {"data": status}) if status else self._error(404, "Batch not found")
+        match = re.fullmatch(rf"{devUrl}/applications/([^/]+)/versions/([^/]+)/batch", route)
+        if method == "POST" and match:
+            batchId = state.createBatch(query.get("operation", ["installApplication"])[0], match.group(1),
+                                        match.group(2), _formLiteral(fields, "infoMap").get("devices", []))
+            return self._send(200, {"data": {"batchId": batchId}})
+        match = re.fullmatch(rf"{devUrl}/applications/names/([^/]+)", route)
+        if method == "GET" and match:
+            app = next((a for a in state.apps if a["title"] == match.group(1)), None)
+            return self._send(200, {"data": {"applicationId": app["applicationId"]}}) if app else self._error(404, "App not found")
+        match = re.fullmatch(rf"{devUrl}/dev-apps/([^/]+)", route)
+        if match:
+            app = next((a for a in state.apps if a["applicationId"] == match.group(1)), None)
+            if app is None:
+                return self._error(404, "App not found")
+            if method == "DELETE":
+                state.apps.remove(app)
+                return self._send(200, {"data": {"applicationId": app["applicationId"]}})
+            return self._send(200, {"data": {"devappdetail": {"versions": list(reversed(app["versions"]))}}})
+        match = re.fullmatch(rf"{devUrl}/applications/([^/]+)/configs", route)
+        if match:
+            configs = state.configs.setdefault(match.group(1), [])
+            if method == "POST":
+                config = dict(json.loads(body or b"{}"), appConfigId=str(uuid.uuid4()), appConfigVersionLst=[])
+                configs.append(config)
+                return self._send(200, {"data": {"appConfigId": config["appConfigId"]}})
+            return self._send(200, {"data": configs})
+        match = re.fullmatch(rf"{devUrl}/applications/([^/]+)/configs/([^/]+)/versions", route)
+        if method == "POST" and match:
+            config = next((c for c in state.configs.get(match.group(1), []) if c["appConfigId"] == match.group(2)), None)
+            if config is None:
+                return self._error(404, "Config not found")
+            version = _formLiteral(fields, "configversion")
+            config["appConfigVersionLst"].insert(0, dict(version, appConfigVersionId=str(uuid.uuid4())))
+            return self._send(200, {"data": {}})
+        if method == "POST" and route == f"{devUrl}/devices/create":
+            definition = json.loads(body or b"{}")
+            name = definition.get("deviceName") or definition.get("name") or f"device{len(state.devices)}"
+            with state.lock:
+                state.devices.append({"deviceId": f"dev-{uuid.uuid4()}", "deviceName": name,
+                                      "isActivationConfirmed": False})
+            return self._send(200, {"onboarding": definition})
+        match = re.fullmatch(rf"{devUrl}/devices/([^/]+)/discovery", route)
+        if method == "GET" and match:
+            device = next((d for d in state.devices if d["deviceName"] == match.group(1)), None)
+            return self._send(200, {"discoveryDetails": device}) if device else self._error(404, "Device not found")
+        if method == "GET" and route == f"{devUrl}/categories":
+            return self._send(200, {"data": [{"name": "Default", "categoryId": "cat-0"}]})
+        return self._error(404, f"Unknown endpoint {method} {route}")
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+def startMockIEM(state=None, host="127.0.0.1", port=0, certfile=None, keyfile=None):
+    """
+    Short: Run the mock IEM in a background thread
+    Description: Returns (server, url). Call server.shutdown() to stop it. With certfile the server speaks HTTPS.
+    """
+    handler = type("BoundMockIEMHandler", (MockIEMHandler,), {"state": state or MockIEMState()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    scheme = "http"
+    if certfile:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(certfile, keyfile)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = "https"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"{scheme}://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8443)
+    parser.add_argument("--cert", help="certificate file, enables HTTPS")
+    parser.add_argument("--key", help="private key file")
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--apps", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error_rate", type=float, default=0.0)
+    parser.add_argument("--rate_limit", type=float, default=0)
+    parser.add_argument("--page_size", type=int, default=100)
+    parser.add_argument("--batch_seconds", type=float, default=1.0)
+    parser.add_argument("--batch_fail_rate", type=float, default=0.0)
+    args = parser.parse_args()
+    state = MockIEMState(args.devices, args.apps, args.latency, args.jitter, args.error_rate, args.rate_limit,
+                         args.page_size, args.batch_seconds, args.batch_fail_rate)
+    server, url = startMockIEM(state, args.host, args.port, args.cert, args.key)
+    print(f"Mock IEM listening on {url}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
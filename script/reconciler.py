@@ -0,0 +1,139 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+import iem_functions_api as api
+
+
+class Action:
+    def __init__(self, kind, deviceName, appTitle, version=None, installedVersion=None):
+        self.kind = kind
+        self.deviceName = deviceName
+        self.appTitle = appTitle
+        self.version = version
+        self.installedVersion = installedVersion
+
+    def __str__(self):
+        if self.kind == "upgrade":
+            return f"{self.kind:<10} {self.deviceName:<30} {self.appTitle} {self.installedVersion} -> {self.version}"
+        return f"{self.kind:<10} {self.deviceName:<30} {self.appTitle} {self.version or ''}"
+
+
+def loadDesiredState(path):
+    """
+    Short: Read a desired-state file
+    Description: JSON object {deviceName: {appTitle: version}}. A version of null means the app must not be installed.
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+def installedVersionOf(app):
+    return str(app.get("versionNumber") or app.get("version") or app.get("versionName") or "")
+
+
+def fetchInstalledApps(tokens, deviceIds, workers=10):
+    """
+    Short: Read the installed apps of devices
+    Description: Fetches the installed apps of every device in parallel. Returns (installed, failures): installed is
+    {deviceName: {appTitle: version}} of the devices that could be read, failures is {deviceName: failed
+    RelevantResponse} of the others.
+    """
+    def fetch(item):
+        name, deviceId = item
+        try:
+            result = tokens.call(api.listIEDAppRecords, deviceId)
+        except Exception as e:
+            result = api.RelevantResponse(False, -1, 'error', e)
+        if not result.success:
+            return name, result
+        return name, {app["title"]: installedVersionOf(app) for app in result.content or []}
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        fetched = dict(pool.map(fetch, deviceIds.items()))
+    failures = {name: result for name, result in fetched.items() if isinstance(result, api.RelevantResponse)}
+    return {name: apps for name, apps in fetched.items() if name not in failures}, failures
+
+
+def computePlan(desired, installed):
+    """Returns the minimal list of install, upgrade and uninstall actions that turns installed into desired."""
+    plan = []
+    for deviceName, apps in desired.items():
+        current = installed.get(deviceName, {})
+        for appTitle, version in apps.items():
+            have = current.get(appTitle)
+            if version is None:
+                if have is not None:
+                    plan.append(Action("uninstall", deviceName, appTitle, installedVersion=have))
+            elif have is None:
+                plan.append(Action("install", deviceName, appTitle, str(version)))
+            elif have != str(version):
+                plan.append(Action("upgrade", deviceName, appTitle, str(version), have))
+    return plan
+
+
+def _resolveApp(tokens, appTitle):
+    """Returns the appId of an app title, or a failed RelevantResponse if it cannot be resolved."""
+    try:
+        appId = tokens.call(api.resolveAppId, appTitle)
+    except api.IEMApiError as e:
+        return e.response
+    except Exception as e:
+        return api.RelevantResponse(False, -1, 'error', e)
+    if not appId:
+        return api.RelevantResponse(False, 404, "UnexpectedBehaviour", f"App {appTitle} not found in IEM catalog")
+    return appId
+
+
+def _versionIds(tokens, appId):
+    """Returns {versionNumber: versionId} of an app, or a failed RelevantResponse."""
+    try:
+        result = tokens.call(api.getAppVersions, appId)
+    except Exception as e:
+        result = api.RelevantResponse(False, -1, 'error', e)
+    if not result.success:
+        return result
+    return {str(v["versionNumber"]): v["versionId"] for v in result.content}
+
+
+def executePlan(tokens, plan, deviceIds, batchSize=api.defaultMaxBatchSize):
+    """
+    Short: Run a reconcile plan
+    Description: Groups the actions so that every (app, version) install and every app uninstall is sent as
+    multi-device batches. Returns a list of (action kind, appTitle, version, device ids, RelevantResponse). Actions
+    of an app that is not in the catalog, or whose versions cannot be listed, get a failed RelevantResponse; the
+    other actions are still run.
+    """
+    installs = {}
+    uninstalls = {}
+    for action in plan:
+        if action.kind == "uninstall":
+            uninstalls.setdefault(action.appTitle, []).append(deviceIds[action.deviceName])
+        else:
+            installs.setdefault((action.appTitle, action.version), []).append(deviceIds[action.deviceName])
+
+    appIds = {title: _resolveApp(tokens, title) for title in {action.appTitle for action in plan}}
+    versionIds = {}
+    results = []
+    for (appTitle, version), devices in installs.items():
+        appId = appIds[appTitle]
+        if isinstance(appId, api.RelevantResponse):
+            results.append(("install", appTitle, version, devices, appId))
+            continue
+        if appId not in versionIds:
+            versionIds[appId] = _versionIds(tokens, appId)
+        if isinstance(versionIds[appId], api.RelevantResponse):
+            results.append(("install", appTitle, version, devices, versionIds[appId]))
+            continue
+        versionId = versionIds[appId].get(version)
+        if versionId is None:
+            results.append(("install", appTitle, version, devices, api.RelevantResponse(
+                False, -1, "UnexpectedBehaviour", f"Version {version} of {appTitle} not found")))
+            continue
+        for chunk, result in tokens.call(api.deployAppToIEDs, appId, versionId, devices, batchSize):
+            results.append(("install", appTitle, version, chunk, result))
+    for appTitle, devices in uninstalls.items():
+        if isinstance(appIds[appTitle], api.RelevantResponse):
+            results.append(("uninstall", appTitle, None, devices, appIds[appTitle]))
+            continue
+        for chunk, result in tokens.call(api.uninstallAppFromIEDs, devices, appIds[appTitle], "", batchSize):
+            results.append(("uninstall", appTitle, None, chunk, result))
+    return results
@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+
+
+class ResolverCache:
+    """
+    Short: Cache of name -> id indexes
+    Description: Holds one hash index per (kind, scope), e.g. device names of one IEM or config versions of one app, so
+    resolving N names costs one listing instead of N. Indexes expire after ttl seconds, can be invalidated explicitly
+    and can be persisted to a JSON file between pipeline runs.
+    : param ttl:                (float) seconds an index stays valid [optional]
+    : param path:               (str) JSON file the indexes are loaded from and saved to [optional]
+    : param refreshOnMissAfter: (float) reload a valid index when a name is missing and the index is older than this [optional]
+    """
+
+    def __init__(self, ttl=300, path=None, refreshOnMissAfter=5.0):
+        self.ttl = ttl
+        self.path = path
+        self.refreshOnMissAfter = refreshOnMissAfter
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._keyLocks = {}
+        if path:
+            self.load()
+
+    @staticmethod
+    def _key(kind, scope):
+        return f"{kind}|{scope}"
+
+    def _fresh(self, entry):
+        return entry is not None and time.time() - entry[0] < self.ttl
+
+    def _keyLock(self, key):
+        with self._lock:
+            return self._keyLocks.setdefault(key, threading.Lock())
+
+    def put(self, kind, scope, index, loadedAt=None):
+        with self._lock:
+            self._indexes[self._key(kind, scope)] = (
+                loadedAt or time.time(), dict(index))
+
+    def _reload(self, key, kind, scope, loader, seen):
+        with self._keyLock(key):
+            with self._lock:
+                entry = self._indexes.get(key)
+            # another thread reloaded while we were waiting for the lock
+            if entry is not None and entry is not seen and self._fresh(entry):
+                return entry[1]
+            index = loader()
+            with self._lock:
+                self.loads += 1
+            self.put(kind, scope, index)
+            return index
+
+    def index(self, kind, scope, loader):
+        """
+        Short: Get a full index
+        Description: Returns the cached index for (kind, scope), calling loader() to build it if it is missing or expired.
+        """
+        key = self._key(kind, scope)
+        with self._lock:
+            entry = self._indexes.get(key)
+        if self._fresh(entry):
+            with self._lock:
+                self.hits += 1
+            return entry[1]
+        with self._lock:
+            self.misses += 1
+        return self._reload(key, kind, scope, loader, entry)
+
+    def resolve(self, kind, scope, name, loader, default=None):
+        """
+        Short: Resolve one name
+        Description: Looks name up in the index for (kind, scope). The index is (re)built with loader() if it is missing,
+        expired, or does not contain name and is older than refreshOnMissAfter seconds.
+        """
+        key = self._key(kind, scope)
+        with self._lock:
+            entry = self._indexes.get(key)
+            if self._fresh(entry) and name in entry[1]:
+                self.hits += 1
+                return entry[1][name]
+            self.misses += 1
+        if self._fresh(entry) and time.time() - entry[0] < self.refreshOnMissAfter:
+            return default
+        return self._reload(key, kind, scope, loader, entry).get(name, default)
+
+    def invalidate(self, kind=None, scope=None):
+        with self._lock:
+            for key in list(self._indexes):
+                entryKind, entryScope = key.split("|", 1)
+                if (kind is None or entryKind == kind) and (scope is None or entryScope == str(scope)):
+                    del self._indexes[key]
+
+    def resetStats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.loads = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "indexes": len(self._indexes),
+            }
+
+    def load(self, path=None):
+        path = path or self.path
+        try:
+            with open(path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return
+        with self._lock:
+            for key, (loadedAt, index) in stored.items():
+                if self._fresh((loadedAt, index)):
+                    self._indexes[key] = (loadedAt, index)
+
+    def save(self, path=None):
+        path = path or self.path
+        if not path:
+            return
+        with self._lock:
+            stored = {key: [loadedAt, index] for key, (loadedAt, index) in self._indexes.items()
+                      if self._fresh((loadedAt, index))}
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(stored, f)
+        os.replace(tmp, path)
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+import iem_functions_api as api
+from batch_watcher import BatchWatcher
+
+defaultJournalPath = "rollout-journal.jsonl"
+
+
+class RolloutJournal:
+    """
+    Short: Append-only record of a rollout
+    Description: Writes one JSON line per event: "planned", "submitted" (with the batch id), "completed" and
+    "failed" device actions of the rollout of one app version. Every line is flushed to disk before the call returns,
+    so the journal survives a killed job and a later run can resume from it. Lines of other rollouts in the same
+    file are ignored.
+    : param path:         (str) file of the journal [required]
+    : param appId:        (str) unique app id [required]
+    : param appVersionId: (str) unique id of the app version [required]
+    """
+
+    def __init__(self, path, appId, appVersionId):
+        self.path = path
+        self.rollout = f"{appId}:{appVersionId}"
+        self._lock = threading.Lock()
+        self._states = {}
+        self._partialLine = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except OSError:
+            return
+        self._partialLine = bool(lines) and not lines[-1].endswith("\n")
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # last line of a job that was killed while writing it
+            if entry.get("rollout") == self.rollout:
+                self._apply(entry)
+
+    def _apply(self, entry):
+        for deviceId in entry["devices"]:
+            self._states[deviceId] = (entry["event"], entry.get("batchId"))
+
+    def record(self, event, deviceIds, batchId=None, **details):
+        entry = {"time": time.time(), "rollout": self.rollout, "event": event,
+                 "devices": list(deviceIds), "batchId": batchId}
+        entry.update(details)
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                if self._partialLine:
+                    f.write("\n")
+                    self._partialLine = False
+                f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(entry)
+
+    def planned(self, deviceIds):
+        self.record("planned", deviceIds)
+
+    def submitted(self, deviceIds, batchId):
+        self.record("submitted", deviceIds, batchId)
+
+    def submitFailed(self, deviceIds, reason):
+        self.record("failed", deviceIds, reason=str(reason))
+
+    def outcomes(self, outcomes):
+        """Records the finished DeviceOutcomes of a BatchWatcher. Devices still running stay submitted."""
+        groups = {}
+        for outcome in outcomes:
+            if outcome.done:
+                event = "completed" if outcome.success else "failed"
+                groups.setdefault((event, outcome.batchId, outcome.state), []).append(outcome.deviceId)
+        for (event, batchId, state), deviceIds in groups.items():
+            self.record(event, deviceIds, batchId, state=state)
+
+    def completed(self):
+        with self._lock:
+            return {deviceId for deviceId, (event, _) in self._states.items() if event == "completed"}
+
+    def inFlight(self):
+        """
+        Returns {batchId: [deviceIds]} of the devices submitted in a batch that has not been seen finishing.
+        Devices submitted without a batch id cannot be polled and count as neither completed nor in flight.
+        """
+        batches = {}
+        with self._lock:
+            for deviceId, (event, batchId) in self._states.items():
+                if event == "submitted" and batchId:
+                    batches.setdefault(batchId, []).append(deviceId)
+        return batches
+
+
+def recordSubmissions(journal, submissions):
+    """Records (device ids, RelevantResponse) batch submissions in the journal, if there is one."""
+    if journal is None:
+        return
+    for chunk, result in submissions:
+        if result.success:
+            journal.submitted(chunk, api.batchIdOf(result.content))
+        else:
+            journal.submitFailed(chunk, result.content)
+
+
+def watchSubmissions(tokens, submitted, timeout, journal=None):
+    """
+    Short: Wait for submitted batches to finish
+    Description: Polls the batches of (batch data, device ids) submissions until they finished or timeout seconds
+    passed, and records the outcomes in the journal, if there is one. Returns (outcomes, untracked) where untracked
+    are the device ids whose submission returned no batch id.
+    """
+    watcher = BatchWatcher(tokens, timeout=timeout)
+    untracked = []
+    for data, chunk in submitted:
+        batchId = api.batchIdOf(data)
+        if batchId:
+            watcher.add(batchId, chunk)
+        else:
+            untracked.extend(chunk)
+    outcomes = watcher.wait()
+    if journal is not None:
+        journal.outcomes(outcomes)
+    return outcomes, untracked
@@ -0,0 +1,116 @@
+import math
+import time
+import iem_functions_api as api
+from batch_watcher import BatchWatcher, printBatchSummary
+from rollout_journal import recordSubmissions, watchSubmissions
+
+
+def planWaves(deviceNames, canaryPercent=5.0, growth=2.0):
+    """
+    Short: Split devices into rollout waves
+    Description: The first wave is the canary (canaryPercent of the devices, at least one). Every following wave is
+    growth times the size of the previous one, until all devices are planned.
+    """
+    remaining = list(deviceNames)
+    if not remaining:
+        return []
+    size = max(1, math.ceil(len(remaining) * canaryPercent / 100))
+    waves = []
+    while remaining:
+        waves.append(remaining[:size])
+        remaining = remaining[size:]
+        size = max(size + 1, math.ceil(size * growth))
+    return waves
+
+
+def _failureRate(outcomes, untracked, failedSubmissions):
+    total = len(outcomes) + len(untracked) + failedSubmissions
+    failed = sum(1 for outcome in outcomes if not outcome.success) + len(untracked) + failedSubmissions
+    return failed / total if total else 0.0
+
+
+def runWaves(tokens, appId, appVersionId, deviceIds, canaryPercent=5.0, growth=2.0, failureThreshold=0.05,
+             batchSize=api.defaultMaxBatchSize, waitTimeout=3600, scheduleInterval=None, journal=None):
+    """
+    Short: Staged rollout of an app version
+    Description: Deploys wave after wave (see planWaves). Each wave is submitted as multi-device batches, so all of
+    its devices install in parallel, and the next wave only starts once the batches of the current one finished with
+    a failure rate of at most failureThreshold. Otherwise the rollout halts.
+    With scheduleInterval, only the canary has to finish before the next wave: the remaining waves start
+    scheduleInterval seconds apart while the earlier ones are still running. Each of them is only submitted if the
+    devices finished so far stay within failureThreshold; otherwise the rollout halts before it.
+    Returns True if every wave stayed within the threshold.
+    : param tokens:           (TokenManager) token manager of the IEM [required]
+    : param appId:            (str) unique app id [required]
+    : param appVersionId:     (str) unique id of the app version [required]
+    : param deviceIds:        (dict) deviceName -> deviceId of all target devices, in rollout order [required]
+    : param canaryPercent:    (float) size of the canary wave in percent of all devices [optional]
+    : param growth:           (float) size factor between consecutive waves [optional]
+    : param failureThreshold: (float) highest tolerated share of failed devices per wave [optional]
+    : param batchSize:        (int) maximum number of devices per batch [optional]
+    : param waitTimeout:      (float) seconds to wait for one wave to finish [optional]
+    : param scheduleInterval: (float) seconds between the starts of the waves after the canary [optional]
+    : param journal:          (RolloutJournal) records every submitted and finished device [optional]
+    """
+    names = {deviceId: name for name, deviceId in deviceIds.items()}
+    waves = planWaves(list(deviceIds), canaryPercent, growth)
+    print(f"Rollout in {len(waves)} waves: {', '.join(str(len(w)) for w in waves)} devices")
+    for number, wave in enumerate(waves, 1):
+        if scheduleInterval and number > 1:
+            return _runScheduled(tokens, appId, appVersionId, waves[number - 1:], deviceIds, names, failureThreshold,
+                                 batchSize, waitTimeout, scheduleInterval, number, journal)
+        start = time.perf_counter()
+        results = tokens.call(api.deployAppToIEDs, appId, appVersionId,
+                              [deviceIds[name] for name in wave], batchSize)
+        recordSubmissions(journal, results)
+        failedSubmissions = sum(len(chunk) for chunk, result in results if not result.success)
+        outcomes, untracked = watchSubmissions(
+            tokens, [(result.content, chunk) for chunk, result in results if result.success], waitTimeout, journal)
+        print(f"Wave {number}/{len(waves)} ({len(wave)} devices, {time.perf_counter() - start:.1f}s)")
+        printBatchSummary(outcomes, names)
+        rate = _failureRate(outcomes, untracked, failedSubmissions)
+        if rate > failureThreshold:
+            print(f"Halting rollout: wave {number} failure rate {rate:.1%} exceeds {failureThreshold:.1%}")
+            return False
+    return True
+
+
+def _runScheduled(tokens, appId, appVersionId, waves, deviceIds, names, failureThreshold, batchSize, waitTimeout,
+                  scheduleInterval, firstNumber, journal=None):
+    watcher = BatchWatcher(tokens, timeout=waitTimeout + len(waves) * scheduleInterval)
+    untracked = []
+    failedSubmissions = 0
+    start = time.time()
+    for offset, wave in enumerate(waves):
+        number = firstNumber + offset
+        # keep polling the running waves until this one is due, then gate it on the devices finished so far
+        finished = [outcome for outcome in watcher.wait(until=start + (offset + 1) * scheduleInterval)
+                    if outcome.done]
+        rate = _failureRate(finished, untracked, failedSubmissions)
+        if rate > failureThreshold:
+            print(f"Halting rollout before wave {number}: failure rate {rate:.1%} exceeds {failureThreshold:.1%}")
+            if journal is not None:
+                journal.outcomes(finished)
+            printBatchSummary(watcher.outcomes(), names)
+            return False
+        results = tokens.call(api.deployAppToIEDs, appId, appVersionId,
+                              [deviceIds[name] for name in wave], batchSize)
+        recordSubmissions(journal, results)
+        for chunk, result in results:
+            batchId = api.batchIdOf(result.content) if result.success else None
+            if batchId:
+                watcher.add(batchId, chunk)
+            elif result.success:
+                untracked.extend(chunk)
+            else:
+                failedSubmissions += len(chunk)
+        print(f"Wave {number} ({len(wave)} devices) started")
+    outcomes = watcher.wait()
+    if journal is not None:
+        journal.outcomes(outcomes)
+    printBatchSummary(outcomes, names)
+    rate = _failureRate(outcomes, untracked, failedSubmissions)
+    if rate > failureThreshold:
+        print(f"Scheduled waves failure rate {rate:.1%} exceeds {failureThreshold:.1%}")
+        return False
+    return True
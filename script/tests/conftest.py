@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import iem_functions_api as api  # noqa: E402
+from mock_iem import MockIEMState, startMockIEM  # noqa: E402
+
+
+@pytest.fixture
+def mockIem():
+    """Starts a mock IEM per test. Yields (state, url); the state can be changed before the first request."""
+    state = MockIEMState(devices=20, batchSeconds=0.2)
+    server, url = startMockIEM(state)
+    yield state, url
+    server.shutdown()
+    server.server_close()
+    api.resolverCache.invalidate()
+
+
+@pytest.fixture
+def token(mockIem):
+    state, url = mockIem
+    return api.loginDirect(url, "user", "password").content
@@ -0,0 +1,131 @@
+import time
+
+import pytest
+
+import iem_policy
+from iem_policy import CallPolicy, CircuitBreaker, CircuitOpenError, TokenBucket
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def sender(*outcomes):
+    """Returns a send() that replays outcomes (responses or exceptions) and counts its calls."""
+    remaining = list(outcomes)
+
+    def send():
+        send.calls += 1
+        outcome = remaining.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+    send.calls = 0
+    return send
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+    monkeypatch.setattr(iem_policy.time, "sleep", slept.append)
+    return slept
+
+
+def test_token_bucket_allows_a_burst_then_waits_for_the_rate():
+    bucket = TokenBucket(rate=50, burst=3)
+
+    assert [bucket.acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    start = time.monotonic()
+    assert bucket.acquire() > 0
+    assert time.monotonic() - start >= 0.015
+
+
+def test_circuit_breaker_opens_after_the_threshold_and_lets_one_trial_through(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(iem_policy.time, "monotonic", lambda: now[0])
+    breaker = CircuitBreaker(failureThreshold=2, resetTimeout=10)
+
+    breaker.recordFailure()
+    assert breaker.retryIn() == 0
+    breaker.recordFailure()
+    assert breaker.state == "open"
+    assert breaker.retryIn() == 10
+
+    now[0] += 10
+    assert breaker.retryIn() == 0
+    assert breaker.state == "half-open"
+    assert breaker.retryIn() > 0  # only the trial call is let through
+
+    breaker.recordFailure()
+    assert breaker.state == "open"
+    now[0] += 10
+    breaker.retryIn()
+    breaker.recordSuccess()
+    assert breaker.state == "closed"
+    assert breaker.retryIn() == 0
+
+
+def test_idempotent_requests_are_retried_on_retry_statuses(sleeps):
+    policy = CallPolicy(maxRetries=3, failureThreshold=0)
+    send = sender(FakeResponse(503), FakeResponse(502), FakeResponse(200))
+
+    assert policy.execute("iem", "get", send).status_code == 200
+    assert send.calls == 3
+    assert len(sleeps) == 2
+    assert policy.stats.retries == 2
+
+
+def test_post_is_only_retried_when_it_was_certainly_not_processed(sleeps):
+    policy = CallPolicy(maxRetries=3, failureThreshold=0)
+
+    assert policy.execute("iem", "POST", sender(FakeResponse(502))).status_code == 502
+    with pytest.raises(TimeoutError):
+        policy.execute("iem", "POST", sender(TimeoutError()), connectErrors=(ConnectionRefusedError,))
+
+    send = sender(ConnectionRefusedError(), FakeResponse(429, {"Retry-After": "2"}), FakeResponse(200))
+    assert policy.execute("iem", "POST", send, connectErrors=lambda e: isinstance(e, ConnectionRefusedError)
+                          ).status_code == 200
+    assert send.calls == 3
+    assert sleeps[-1] == 2.0
+    assert policy.stats.throttled == 1
+
+
+def test_retry_stops_when_the_body_cannot_be_rewound(sleeps):
+    policy = CallPolicy(maxRetries=3, failureThreshold=0)
+    send = sender(FakeResponse(503), FakeResponse(200))
+
+    assert policy.execute("iem", "GET", send, rewind=lambda: False).status_code == 503
+    assert send.calls == 1
+
+
+def test_open_circuit_rejects_requests(sleeps):
+    policy = CallPolicy(maxRetries=0, failureThreshold=2, resetTimeout=30)
+    for _ in range(2):
+        policy.execute("iem", "GET", sender(FakeResponse(500)))
+
+    with pytest.raises(CircuitOpenError):
+        policy.execute("iem", "GET", sender(FakeResponse(200)))
+    assert policy.stats.circuitRejections == 1
+    assert policy.execute("other", "GET", sender(FakeResponse(200))).status_code == 200
+
+
+def test_unexpected_error_of_the_trial_call_does_not_wedge_the_breaker(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(iem_policy.time, "monotonic", lambda: now[0])
+    policy = CallPolicy(maxRetries=0, failureThreshold=1, resetTimeout=1)
+    policy.execute("iem", "GET", sender(FakeResponse(500)))
+
+    now[0] += 1
+    with pytest.raises(KeyError):
+        policy.execute("iem", "GET", sender(KeyError("body")), errors=(OSError,))
+    assert policy.breaker("iem").state == "open"
+
+    now[0] += 1
+    assert policy.execute("iem", "GET", sender(FakeResponse(200))).status_code == 200
+    assert policy.breaker("iem").state == "closed"
@@ -0,0 +1,42 @@
+import json
+
+from config_sync import syncConfigurations
+from token_manager import TokenManager
+
+
+def test_unchanged_configuration_is_not_uploaded_again(mockIem, tmp_path, capsys):
+    state, url = mockIem
+    (tmp_path / "settings.json").write_text(json.dumps({"interval": 5}))
+    (tmp_path / "manifest.json").write_text(json.dumps([
+        {"appTitle": "app0", "displayName": "settings", "description": "Settings", "volPath": "/cfg",
+         "relativePath": "", "file": "settings.json"}]))
+    tokens = TokenManager(url, "user", "password", logoutAtExit=False)
+
+    assert syncConfigurations(tokens, str(tmp_path)) == 0
+    assert "1 of 1 configurations changed" in capsys.readouterr().out
+    assert syncConfigurations(tokens, str(tmp_path)) == 0
+    assert "0 of 1 configurations changed" in capsys.readouterr().out
+
+    versions = state.configs["app-0000"][0]["appConfigVersionLst"]
+    assert len(versions) == 1
+    assert "sha256:" in versions[0]["description"]
+
+
+def test_failing_entries_are_reported_without_aborting_the_sync(mockIem, tmp_path, capsys):
+    state, url = mockIem
+    (tmp_path / "settings.json").write_text(json.dumps({"interval": 5}))
+    (tmp_path / "manifest.json").write_text(json.dumps([
+        {"appTitle": "nope", "displayName": "settings", "description": "Settings", "volPath": "/cfg",
+         "relativePath": "", "file": "settings.json"},
+        {"appTitle": "app0", "displayName": "missing", "description": "Missing file", "volPath": "/cfg",
+         "relativePath": "", "file": "missing.json"},
+        {"appTitle": "app1", "displayName": "settings", "description": "Settings", "volPath": "/cfg",
+         "relativePath": "", "file": "settings.json"}]))
+    tokens = TokenManager(url, "user", "password", logoutAtExit=False)
+
+    assert syncConfigurations(tokens, str(tmp_path)) == 2
+
+    out = capsys.readouterr().out
+    assert "App nope not found in IEM catalog" in out
+    assert "1/3 configurations updated" in out
+    assert len(state.configs["app-0001"][0]["appConfigVersionLst"]) == 1
@@ -0,0 +1,35 @@
+import iem_functions_api as api
+from device_onboarding import onboardDevices, onboardingFileName, waitForActivation
+from token_manager import TokenManager
+
+
+def test_onboarding_file_names_are_safe():
+    assert onboardingFileName("edge 1/../x", 0) == "edge_1_.._x.json"
+    assert onboardingFileName("..", 3) == "device-3.json"
+
+
+def test_onboard_and_wait_for_activation(mockIem, tmp_path):
+    state, url = mockIem
+    state.maxPageSize = 5
+    tokens = TokenManager(url, "user", "password", logoutAtExit=False)
+
+    created = onboardDevices(tokens, [{"deviceName": "edge a/1"}, {"description": "no name"}], str(tmp_path))
+
+    assert created == ["edge a/1"]
+    assert (tmp_path / "edge_a_1.json").exists()
+    assert waitForActivation(tokens, created, interval=0.1, timeout=0.3) == {"edge a/1"}
+    for device in state.devices:
+        device["isActivationConfirmed"] = True
+    assert waitForActivation(tokens, created, interval=0.1, timeout=1) == set()
+
+
+def test_activation_status_uses_the_port_of_the_url(mockIem, token):
+    state, url = mockIem
+    state.maxPageSize = 3
+
+    result = api.getActivationStatusOfDevices(url, token, ["device0", "device19", "unknown"])
+
+    assert result.success
+    assert result.content == {"device0": True, "device19": True, "unknown": False}
+    assert api._withPort("https://iem.example", 9443) == "https://iem.example:9443"
+    assert api._withPort("https://iem.example:8443/", 9443) == "https://iem.example:8443"
@@ -0,0 +1,17 @@
+import hashlib
+import io
+
+import iem_functions_api as api
+
+
+def test_hash_of_binary_and_text_files_match(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text('{"interval": 5}')
+    expected = hashlib.sha256(b'{"interval": 5}').hexdigest()
+
+    assert api.fileSha256(str(path)) == expected
+    assert api.fileSha256(io.BytesIO(b'{"interval": 5}'), chunkSize=4) == expected
+    assert api.fileSha256(io.StringIO('{"interval": 5}'), chunkSize=4) == expected
+    with open(path) as f:
+        assert api.fileSha256(f) == expected
+        assert f.read() == '{"interval": 5}'
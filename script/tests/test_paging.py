@@ -0,0 +1,42 @@
+import pytest
+
+import iem_functions_api as api
+import iem_metrics
+from iem_models import Device
+from mock_iem import MockIEMState
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_listing_is_complete_when_the_iem_caps_the_page_size(mockIem, token, stream):
+    state, url = mockIem
+    state.devices = MockIEMState(devices=230).devices
+    state.maxPageSize = 50
+
+    devices = list(api.iterIEDs(url, token, prefetch=True, model=Device, stream=stream))
+
+    assert len(devices) == 230
+    assert api.resolveDeviceId(url, token, "device150") == "dev-000150"
+
+
+def test_empty_listing(mockIem, token):
+    state, url = mockIem
+    state.devices = []
+
+    assert list(api.iterIEDs(url, token)) == []
+
+
+def test_paged_listings_are_instrumented_under_their_endpoint(mockIem, token):
+    state, url = mockIem
+    state.maxPageSize = 5
+    previous = iem_metrics.getInstrumentation()
+    metrics = iem_metrics.setInstrumentation(iem_metrics.Instrumentation(enabled=True))
+    try:
+        list(api.iterIEDs(url, token, pageSize=5, prefetch=True))
+        list(api.iterApps(url, token))
+    finally:
+        iem_metrics.setInstrumentation(previous)
+
+    summary = metrics.summary()
+    assert summary["GET listIEDs"]["count"] == 4
+    assert "GET listApps" in summary
+    assert not any("listPaged" in key for key in summary)
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+import api_handler
+from iem_models import InstalledApp
+from reconciler import computePlan, executePlan, installedVersionOf
+from token_manager import TokenManager
+
+
+@pytest.mark.parametrize("field", ["versionNumber", "version", "versionName"])
+def test_installed_version_is_read_from_every_version_field(field):
+    app = InstalledApp.fromJson({"applicationId": "a", "title": "app0", field: "1.2"})
+
+    assert installedVersionOf(app) == "1.2"
+    assert computePlan({"device0": {"app0": "1.2"}}, {"device0": {"app0": installedVersionOf(app)}}) == []
+
+
+def test_unknown_app_fails_only_its_own_actions(mockIem):
+    state, url = mockIem
+    tokens = TokenManager(url, "user", "password", logoutAtExit=False)
+    deviceIds = {"device1": "dev-000001", "device2": "dev-000002"}
+    plan = computePlan({"device1": {"nosuchapp": "1.0", "app0": "0.0.1"}, "device2": {"app1": "9.9"}},
+                       {"device1": {}, "device2": {}})
+
+    results = {(kind, title): result for kind, title, _, _, result in executePlan(tokens, plan, deviceIds)}
+
+    assert not results[("install", "nosuchapp")].success
+    assert "not found" in results[("install", "nosuchapp")].content
+    assert results[("install", "app0")].success
+    assert not results[("install", "app1")].success
+    assert len(state.batches) == 1
+
+
+def test_reconcile_reports_an_unknown_app_instead_of_raising(mockIem, tmp_path, monkeypatch):
+    state, url = mockIem
+    monkeypatch.setenv("IE_URL", url)
+    monkeypatch.setenv("IE_USER", "user")
+    monkeypatch.setenv("IE_PASSWORD", "password")
+    desired = tmp_path / "desired.json"
+    desired.write_text(json.dumps({"device1": {"nosuchapp": "1.0"}}))
+
+    assert api_handler.main(["reconcile", "--desired_state", str(desired)], persistent=True) == 1
@@ -0,0 +1,45 @@
+import pytest
+
+import api_handler
+from rollout_journal import RolloutJournal
+
+
+@pytest.fixture
+def pipeline(mockIem, tmp_path, monkeypatch):
+    state, url = mockIem
+    monkeypatch.setenv("IE_URL", url)
+    monkeypatch.setenv("IE_USER", "user")
+    monkeypatch.setenv("IE_PASSWORD", "password")
+    monkeypatch.setenv("APP_ID", "app-0000")
+    journalPath = str(tmp_path / "journal.jsonl")
+
+    def run(*extra):
+        argv = ["pipeline", "--batch", "--batch_size", "4", "--appVersionID", "app-0000-v1",
+                "--devices", ",".join(f"device{i}" for i in range(10)), "--journal", journalPath, *extra]
+        return api_handler.main(argv, persistent=True)
+
+    return state, journalPath, run
+
+
+def test_resume_polls_running_batches_instead_of_deploying_again(pipeline):
+    state, journalPath, run = pipeline
+
+    assert run() == 0
+    assert len(state.batches) == 3
+    assert run("--resume", "--wait") == 0
+
+    assert len(state.batches) == 3
+    journal = RolloutJournal(journalPath, "app-0000", "app-0000-v1")
+    assert journal.completed() == {f"dev-{i:06d}" for i in range(10)}
+    assert journal.inFlight() == {}
+
+
+def test_resume_deploys_only_the_remaining_devices(pipeline):
+    state, journalPath, run = pipeline
+    journal = RolloutJournal(journalPath, "app-0000", "app-0000-v1")
+    journal.record("completed", [f"dev-{i:06d}" for i in range(6)], "earlier-batch")
+
+    assert run("--resume") == 0
+
+    submitted = [job["deviceId"] for batch in state.batches.values() for job in batch["jobs"]]
+    assert sorted(submitted) == [f"dev-{i:06d}" for i in range(6, 10)]
@@ -0,0 +1,27 @@
+from rollout_scheduler import planWaves, runWaves
+from token_manager import TokenManager
+
+
+def test_plan_waves():
+    assert [len(wave) for wave in planWaves(range(20), canaryPercent=5, growth=2)] == [1, 2, 4, 8, 5]
+
+
+def test_scheduled_waves_pin_the_version_and_halt_on_failures(mockIem):
+    state, url = mockIem
+    state.batchSeconds = 0.1
+    createBatch = state.createBatch
+
+    def failAfterCanary(*args):
+        batchId = createBatch(*args)
+        state.batchFailRate = 1.0
+        return batchId
+
+    state.createBatch = failAfterCanary
+    tokens = TokenManager(url, "user", "password", logoutAtExit=False)
+    deviceIds = {device["deviceName"]: device["deviceId"] for device in state.devices}
+
+    assert not runWaves(tokens, "app-0000", "app-0000-v1", deviceIds, canaryPercent=5, growth=2,
+                        failureThreshold=0.1, waitTimeout=10, scheduleInterval=0.5)
+
+    assert {batch["versionId"] for batch in state.batches.values()} == {"app-0000-v1"}
+    assert sorted(len(batch["jobs"]) for batch in state.batches.values()) == [1, 2]
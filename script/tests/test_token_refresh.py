@@ -0,0 +1,66 @@
+import token_manager
+from token_manager import TokenManager
+
+import api_handler
+import iem_functions_api as api
+
+
+def test_call_logs_in_again_after_401(mockIem):
+    state, url = mockIem
+    tokens = TokenManager(url, "user", "password", logoutAtExit=False)
+    tokens.token()
+    state.expireTokens()
+
+    result = tokens.call(api.listIEDRecords)
+
+    assert result.success
+    assert len(result.content) == len(state.devices)
+    assert tokens.refreshes == 1
+
+
+def test_multi_device_call_repeats_only_rejected_chunks(mockIem):
+    state, url = mockIem
+    tokens = TokenManager(url, "user", "password", logoutAtExit=False)
+    tokens.token()
+    state.expireTokens()
+    deviceIds = [device["deviceId"] for device in state.devices[:10]]
+
+    results = tokens.call(api.deployAppToIEDs, "app-0000", "app-0000-v1", deviceIds, 4)
+
+    assert all(result.success for _, result in results)
+    assert sorted(deviceId for chunk, _ in results for deviceId in chunk) == deviceIds
+    assert len(state.batches) == 3
+    assert tokens.refreshes == 1
+
+
+def test_single_device_deploy_logs_in_again_after_401(mockIem):
+    state, url = mockIem
+    tokens = TokenManager(url, "user", "password", logoutAtExit=False)
+    tokens.token()
+    state.expireTokens()
+
+    name, result, _ = api_handler.deploy_to_device(tokens, "app-0000", "app-0000-v1", "device3", "dev-000003")
+
+    assert name == "device3"
+    assert result.success
+    assert api.batchIdOf(result.content) in state.batches
+    assert tokens.refreshes == 1
+
+
+def test_device_lookup_logs_in_again_when_the_cached_token_was_revoked(mockIem, tmp_path, monkeypatch):
+    state, url = mockIem
+    monkeypatch.setenv("IE_URL", url)
+    monkeypatch.setenv("IE_USER", "user")
+    monkeypatch.setenv("IE_PASSWORD", "password")
+    monkeypatch.setenv("APP_ID", "app-0000")
+    argv = ["pipeline", "--batch", "--appVersionID", "app-0000-v1", "--devices", "device1,device2",
+            "--token_cache", str(tmp_path / "token.json")]
+    assert api_handler.main(argv, persistent=True) == 0
+
+    # a new job starts with the cached token, which the IEM no longer accepts
+    monkeypatch.setattr(token_manager, "_managers", {})
+    api.resolverCache.invalidate()
+    state.expireTokens()
+
+    assert api_handler.main(argv, persistent=True) == 0
+    assert len(state.batches) == 2
@@ -0,0 +1,190 @@
+import atexit
+import base64
+import inspect
+import json
+import os
+import threading
+import time
+import iem_functions_api as api
+
+
+def _tokenExpiry(token):
+    """Returns the exp claim of a JWT bearer token, or None if the token is not a readable JWT."""
+    try:
+        payload = token.split()[-1].split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except (IndexError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _isUnauthorized(result):
+    if isinstance(result, api.RelevantResponse):
+        return str(result.statusCode) == "401"
+    return False
+
+
+def _unauthorizedChunks(result):
+    """Returns the device chunks of a multi-device result [(chunk, RelevantResponse)] that were rejected with 401."""
+    if not isinstance(result, list):
+        return []
+    return [item[0] for item in result
+            if isinstance(item, tuple) and len(item) == 2 and _isUnauthorized(item[1])]
+
+
+class TokenManager:
+    """
+    Short: Share one IEM login between all calls of a run
+    Description: Logs in on first use and hands the same bearer token to every caller, from any thread. The token is
+    renewed only when it is about to expire or when the IEM answers 401. It can be cached on disk so that the next
+    pipeline job reuses it instead of logging in again; otherwise it is logged out at exit.
+    : param iemUrl:          (str) the address of iem [required]
+    : param username:        (str) the username for login [required]
+    : param password:        (str) the the password for login [required]
+    : param cacheFile:       (str) file the token is cached in between runs [optional]
+    : param refreshMargin:   (float) renew the token this many seconds before it expires [optional]
+    : param defaultLifetime: (float) lifetime assumed for tokens that carry no expiry [optional]
+    : param logoutAtExit:    (bool) log out at interpreter exit. Default: only if the token is not cached on disk [optional]
+    """
+
+    def __init__(self, iemUrl, username, password, cacheFile=None, refreshMargin=60, defaultLifetime=3600, logoutAtExit=None):
+        self.iemUrl = iemUrl
+        self.username = username
+        self.password = password
+        self.cacheFile = cacheFile
+        self.refreshMargin = refreshMargin
+        self.defaultLifetime = defaultLifetime
+        self.logoutAtExit = not cacheFile if logoutAtExit is None else logoutAtExit
+        self.logins = 0
+        self.refreshes = 0
+        self._token = None
+        self._expiresAt = 0
+        self._lock = threading.Lock()
+        if cacheFile:
+            self._loadCache()
+        atexit.register(self.close)
+
+    def _valid(self):
+        return self._token is not None and time.time() < self._expiresAt - self.refreshMargin
+
+    def _login(self):
+        response = api.loginDirect(self.iemUrl, self.username, self.password)
+        if not response.success:
+            raise api.IEMApiError(response)
+        self._token = response.content
+        self._expiresAt = _tokenExpiry(
+            self._token) or time.time() + self.defaultLifetime
+        self.logins += 1
+        self._saveCache()
+
+    def token(self):
+        """Returns a valid bearer token, logging in only if there is none or it is about to expire."""
+        with self._lock:
+            if not self._valid():
+                self._login()
+            return self._token
+
+    def refresh(self, staleToken=None):
+        """
+        Short: Renew the token after a 401
+        Description: Logs in again unless another thread already replaced staleToken, and returns the current token.
+        """
+        with self._lock:
+            if staleToken is None or staleToken == self._token:
+                self.refreshes += 1
+                self._login()
+            return self._token
+
+    def call(self, func, *args, **kwargs):
+        """
+        Short: Call an iem_functions_api function with the managed token
+        Description: Calls func(iemUrl, token, *args, **kwargs) and repeats the call once with a fresh token if the IEM
+        answered 401.
+        """
+        token = self.token()
+        try:
+            result = func(self.iemUrl, token, *args, **kwargs)
+        except api.IEMApiError as e:
+            if not _isUnauthorized(e.response):
+                raise
+            return func(self.iemUrl, self.refresh(token), *args, **kwargs)
+        if _isUnauthorized(result):
+            result = func(self.iemUrl, self.refresh(token), *args, **kwargs)
+        elif _unauthorizedChunks(result):
+            result = self._retryChunks(func, token, result, args, kwargs)
+        return result
+
+    def _retryChunks(self, func, staleToken, results, args, kwargs):
+        """
+        Repeats a multi-device call (deployAppToIEDs, installAppWithoutConfOnIEDs, ...) for the chunks rejected with
+        401 only, so that no batch the IEM accepted is submitted twice.
+        """
+        rejected = _unauthorizedChunks(results)
+        try:
+            bound = inspect.signature(func).bind(self.iemUrl, None, *args, **kwargs)
+        except (TypeError, ValueError):
+            bound = None
+        name = next((name for name in ("deviceIds", "deviceids") if bound and name in bound.arguments), None)
+        if name is None:
+            if len(rejected) < len(results):
+                return results  # cannot repeat part of the call without submitting the accepted chunks again
+            return func(self.iemUrl, self.refresh(staleToken), *args, **kwargs)
+        bound.arguments[list(bound.arguments)[1]] = self.refresh(staleToken)
+        bound.arguments[name] = [deviceId for chunk in rejected for deviceId in chunk]
+        accepted = [(chunk, result) for chunk, result in results if not _isUnauthorized(result)]
+        return accepted + list(func(*bound.args, **bound.kwargs))
+
+    def _loadCache(self):
+        try:
+            with open(self.cacheFile) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cached.get("iemUrl") == self.iemUrl and cached.get("username") == self.username:
+            self._token = cached.get("token")
+            self._expiresAt = cached.get("expiresAt", 0)
+
+    def _saveCache(self):
+        if not self.cacheFile:
+            return
+        tmp = f"{self.cacheFile}.tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"iemUrl": self.iemUrl, "username": self.username,
+                       "token": self._token, "expiresAt": self._expiresAt}, f)
+        os.replace(tmp, self.cacheFile)
+
+    def logout(self):
+        with self._lock:
+            token, self._token = self._token, None
+            self._expiresAt = 0
+        if self.cacheFile:
+            try:
+                os.remove(self.cacheFile)
+            except OSError:
+                pass
+        if token:
+            return api.logout(self.iemUrl, token)
+
+    def close(self):
+        if self.logoutAtExit and self._token:
+            self.logout()
+
+
+_managers = {}
+_managersLock = threading.Lock()
+
+
+def getTokenManager(iemUrl, username, password, **kwargs):
+    """
+    Short: Get the shared token manager of an IEM user
+    Description: Returns one TokenManager per (iemUrl, username, password, cacheFile), creating it with kwargs on first
+    use. A changed password or cache file gets a new manager instead of the one logged in with the old settings.
+    """
+    key = (iemUrl, username, password, kwargs.get("cacheFile"))
+    with _managersLock:
+        manager = _managers.get(key)
+        if manager is None:
+            manager = TokenManager(iemUrl, username, password, **kwargs)
+            _managers[key] = manager
+        return manager